@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+# Error codes (compared lowercase) that mean the caller is sending too fast. Errors
+# raised from inside a response event stream use camelCase codes, hence lowercase.
+THROTTLING_CODES = frozenset((
+    'throttlingexception', 'toomanyrequestsexception', 'throttledexception', 'requestlimitexceeded'
+))
+# Transient service-side errors that are retried without shrinking the limit
+TRANSIENT_CODES = frozenset((
+    'serviceunavailableexception', 'internalserverexception', 'dependencyfailedexception',
+    'badgatewayexception', 'modelnotreadyexception'
+))
+
+
+# Raised when an agent call cannot be made within the limiter's budget
+class AgentThrottledError(Exception):
+    pass
+
+
+def _error_code(error):
+    response = getattr(error, 'response', None) or {}
+    return str(response.get('Error', {}).get('Code', '')).lower()
+
+
+def is_capacity_error(error):
+    """True if error means the endpoint is overloaded or unavailable rather than the request being bad"""
+    if isinstance(error, AgentThrottledError):
+        return True
+    code = _error_code(error)
+    return code in THROTTLING_CODES or code in TRANSIENT_CODES
+
+
+def _retry_after_seconds(error):
+    # Retry-After header (seconds) if the service sent one
+    response = getattr(error, 'response', None) or {}
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {}) or {}
+    value = headers.get('retry-after')
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Token bucket limiting the request rate; callers reserve a token and wait for it
+class TokenBucket:
+    """
+    Args:
+        rate: Tokens added per second (0 disables rate limiting)
+        burst: Bucket capacity
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return the seconds to wait before using it"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+# Slot request waiting in the limiter's queue (thread or coroutine)
+class _Waiter:
+    __slots__ = ('event', 'loop', 'future', 'granted')
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.event = event
+        self.loop = loop
+        self.future = future
+        self.granted = False
+
+
+# AIMD concurrency limit, token bucket and retries in front of one agent alias
+class AdaptiveLimiter:
+    """
+    Client-side flow control for Bedrock agent calls
+
+    Callers take a slot before calling the agent; slots are granted in arrival order
+    from a single FIFO queue shared by threads and coroutines. The number of slots
+    follows AIMD: every successful call adds increase/limit (about +increase per
+    round of calls) and a throttled call multiplies it by decrease_factor. Only calls
+    started after the last decrease can lower the limit again, so a burst of throttles
+    from the same overload counts once. An optional token bucket caps the request rate
+    below the alias quota. Throttled and transient failures are retried with full-jitter
+    exponential backoff, waiting at least as long as the service's Retry-After hint.
+
+    Args:
+        name: Label used in metrics and logs (e.g. the agent alias)
+        initial_limit: Starting number of concurrent calls
+        min_limit: Lower bound of the concurrency limit
+        max_limit: Upper bound of the concurrency limit
+        increase: Additive increase per round of successful calls
+        decrease_factor: Multiplier applied to the limit on throttling
+        rate_per_second: Token bucket rate (0 disables it)
+        burst: Token bucket capacity
+        max_attempts: Attempts per call, including the first
+        base_delay_seconds: Backoff for the first retry
+        max_delay_seconds: Upper bound of the computed backoff
+        queue_timeout_seconds: Longest a caller waits for a slot
+    """
+
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=16, increase=1.0, decrease_factor=0.7,
+                 rate_per_second=0.0, burst=None, max_attempts=4,
+                 base_delay_seconds=0.5, max_delay_seconds=20.0, queue_timeout_seconds=60.0):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.bucket = TokenBucket(rate_per_second, burst if burst is not None else max(1.0, rate_per_second))
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = float('-inf')
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        registry.set_gauge("chatbot_agent_concurrency_limit", {"alias": self.name}, round(self.limit, 2),
+                           help_text="Current AIMD concurrency limit per agent alias")
+
+    # --- slots ---
+    def _try_take(self):
+        # Caller holds the lock; queued callers go first
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _dispatch(self):
+        # Caller holds the lock: hand free slots to the head of the queue
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            if waiter.event is not None:
+                waiter.event.set()
+            else:
+                waiter.loop.call_soon_threadsafe(self._wake, waiter.future)
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(True)
+
+    def _abandon(self, waiter, keep_granted):
+        # Timed out or cancelled: leave the queue. Returns True if a slot was granted
+        # meanwhile and is kept; otherwise a granted slot is handed to the next caller.
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return False
+            if keep_granted:
+                return True
+            self.in_flight -= 1
+            self._dispatch()
+            return False
+
+    def _queue_timeout(self, waited_since):
+        registry.inc("chatbot_agent_calls_total", {"alias": self.name, "outcome": "queue_timeout"},
+                     help_text="Agent calls by final outcome")
+        raise AgentThrottledError(
+            f"No agent capacity on {self.name} after waiting {time.monotonic() - waited_since:.1f}s"
+        )
+
+    def acquire(self):
+        """Block until a slot is free (FIFO); raises AgentThrottledError after queue_timeout_seconds"""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_take():
+                return
+            waiter = _Waiter(event=threading.Event())
+            self._waiters.append(waiter)
+        if not waiter.event.wait(self.queue_timeout_seconds) and not self._abandon(waiter, keep_granted=True):
+            self._queue_timeout(start)
+        registry.observe("chatbot_agent_queue_wait_seconds", {"alias": self.name}, time.monotonic() - start,
+                         help_text="Time agent calls waited for a limiter slot")
+
+    async def aacquire(self):
+        """Coroutine version of acquire sharing the same FIFO queue"""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_take():
+                return
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(loop=loop, future=loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter, keep_granted=True):
+                self._queue_timeout(start)
+        except asyncio.CancelledError:
+            self._abandon(waiter, keep_granted=False)
+            raise
+        registry.observe("chatbot_agent_queue_wait_seconds", {"alias": self.name}, time.monotonic() - start,
+                         help_text="Time agent calls waited for a limiter slot")
+
+    def release(self, throttled=False, succeeded=True, started_at=None):
+        """Return a slot and adapt the limit to the outcome of a call started at started_at"""
+        with self._lock:
+            self.in_flight -= 1
+            if throttled:
+                if started_at is None or started_at > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+                    logger.info(f"Agent limiter {self.name}: throttled, limit lowered to {self.limit:.2f}")
+            elif succeeded:
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._dispatch()
+        self._publish()
+
+    # --- retries ---
+    def _retry_delay(self, error, attempt, retry_if):
+        """Seconds to wait before retrying error, or None if it must not be retried"""
+        code = _error_code(error)
+        if code not in THROTTLING_CODES and code not in TRANSIENT_CODES:
+            return None
+        if attempt + 1 >= self.max_attempts or (retry_if is not None and not retry_if()):
+            return None
+        backoff = self._random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** attempt))
+        hint = _retry_after_seconds(error)
+        return max(backoff, hint) if hint is not None else backoff
+
+    def _failed(self, error, attempt, retry_if):
+        # Decide between retrying (returns the delay) and giving up (raises)
+        code = _error_code(error)
+        delay = self._retry_delay(error, attempt, retry_if)
+        if delay is not None:
+            registry.inc("chatbot_agent_retries_total", {"alias": self.name, "reason": code},
+                         help_text="Agent call retries by error code")
+            logger.info(f"Agent call on {self.name} failed with {code}, retry {attempt + 1} in {delay:.2f}s")
+            return delay
+        outcome = "throttled" if code in THROTTLING_CODES else "error"
+        registry.inc("chatbot_agent_calls_total", {"alias": self.name, "outcome": outcome},
+                     help_text="Agent calls by final outcome")
+        if code in THROTTLING_CODES:
+            raise AgentThrottledError(f"Agent {self.name} still throttled after {attempt + 1} attempt(s)") from error
+        raise error
+
+    def _succeeded(self):
+        registry.inc("chatbot_agent_calls_total", {"alias": self.name, "outcome": "ok"},
+                     help_text="Agent calls by final outcome")
+
+    def call(self, fn, *args, retry_if=None):
+        """
+        Call fn(*args) under the limiter, retrying throttled and transient failures
+
+        Args:
+            fn: Blocking function making one agent call
+            retry_if: Optional callable; a failed attempt is only retried while it returns True
+                (e.g. nothing has been streamed to the user yet)
+
+        Returns:
+            The result of fn
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            started_at = time.monotonic()
+            try:
+                time.sleep(self.bucket.reserve())
+                result = fn(*args)
+            except Exception as e:
+                self.release(_error_code(e) in THROTTLING_CODES, succeeded=False, started_at=started_at)
+                delay = self._failed(e, attempt, retry_if)
+            else:
+                self.release()
+                self._succeeded()
+                return result
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, fn, *args, retry_if=None):
+        """Like call, but waits for slots, tokens and backoff without blocking the event loop; fn runs in a thread"""
+        attempt = 0
+        while True:
+            await self.aacquire()
+            started_at = time.monotonic()
+            try:
+                await asyncio.sleep(self.bucket.reserve())
+                result = await asyncio.to_thread(fn, *args)
+            except asyncio.CancelledError:
+                self.release(succeeded=False)
+                raise
+            except Exception as e:
+                self.release(_error_code(e) in THROTTLING_CODES, succeeded=False, started_at=started_at)
+                delay = self._failed(e, attempt, retry_if)
+            else:
+                self.release()
+                self._succeeded()
+                return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {'limit': round(self.limit, 2), 'in_flight': self.in_flight, 'queued': len(self._waiters)}
+
+
+# One AdaptiveLimiter per key (agent alias), created on first use with shared settings
+class LimiterPool:
+    def __init__(self, **settings):
+        self.settings = settings
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(name)
+                if limiter is None:
+                    limiter = self._limiters[name] = AdaptiveLimiter(name, **self.settings)
+        return limiter
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in list(self._limiters.items())}
@@ -0,0 +1,211 @@
+import json
+import logging
+import random
+import threading
+import time
+
+from metrics import registry
+from utils import get_boto3_client
+
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STRATEGIES = ('least_outstanding', 'weighted')
+_BREAKER_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+# One Bedrock agent alias in one region, with its own client and circuit breaker
+class AgentEndpoint:
+    """
+    Args:
+        agent_id: Bedrock agent id
+        alias_id: Agent alias id
+        region: AWS region of the agent
+        profile: AWS profile used for the client
+        weight: Relative share of new threads routed here
+        failure_threshold: Consecutive failures that open the circuit
+        open_seconds: Time the circuit stays open before a probe call is allowed
+    """
+
+    def __init__(self, agent_id, alias_id, region='us-east-1', profile='chatbot', weight=1.0,
+                 failure_threshold=5, open_seconds=30.0):
+        self.agent_id = agent_id
+        self.alias_id = alias_id
+        self.region = region
+        self.profile = profile
+        self.weight = max(float(weight), 0.0)
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.name = f"{agent_id}/{alias_id}@{region}"
+        self.client = None
+        self.model = None
+        self.outstanding = 0
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def get_client(self):
+        """bedrock-agent-runtime client for this endpoint's profile and region"""
+        if self.client is None:
+            self.client = get_boto3_client('bedrock-agent-runtime', profile_name=self.profile, region_name=self.region)
+        return self.client
+
+    def get_model(self):
+        """BedrockAgentsRunnable for the non-streaming path, built on first use"""
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    from langchain_aws.agents import BedrockAgentsRunnable
+
+                    self.model = BedrockAgentsRunnable(
+                        agent_id=self.agent_id,
+                        agent_alias_id=self.alias_id,
+                        client=self.get_client()
+                    )
+        return self.model
+
+    def _publish(self):
+        registry.set_gauge("chatbot_agent_endpoint_state", {"endpoint": self.name}, _BREAKER_STATE_VALUES[self.state],
+                           help_text="Circuit breaker state per agent endpoint (0 closed, 1 half-open, 2 open)")
+
+    def available(self, now):
+        """True if a new call may be routed here"""
+        if self.weight <= 0:
+            return False
+        with self._lock:
+            if self.state == 'open' and now - self.opened_at >= self.open_seconds:
+                self.state = 'half_open'
+                self._publish()
+            if self.state == 'half_open':
+                return not self._probe_in_flight
+            return self.state == 'closed'
+
+    def begin(self):
+        with self._lock:
+            self.outstanding += 1
+            if self.state == 'half_open':
+                self._probe_in_flight = True
+
+    def finish(self, ok):
+        """Record a call's outcome and move the circuit breaker (ok=None: no verdict, e.g. cancelled)"""
+        with self._lock:
+            self.outstanding -= 1
+            self._probe_in_flight = False
+            previous = self.state
+            if ok is None:
+                return
+            if ok:
+                self.consecutive_failures = 0
+                self.state = 'closed'
+            else:
+                self.consecutive_failures += 1
+                if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                    self.state = 'open'
+                    self.opened_at = time.monotonic()
+        if self.state != previous:
+            logger.warning(f"Agent endpoint {self.name}: circuit {previous} -> {self.state}")
+            self._publish()
+        registry.inc("chatbot_agent_endpoint_calls_total", {"endpoint": self.name, "outcome": "ok" if ok else "failure"},
+                     help_text="Agent calls per endpoint")
+
+    def stats(self):
+        return {'state': self.state, 'outstanding': self.outstanding, 'consecutive_failures': self.consecutive_failures}
+
+
+# Routes agent calls across several endpoints
+class AgentEndpointPool:
+    """
+    Pool of agent endpoints with sticky, health-aware routing
+
+    A thread keeps its endpoint (and so its Bedrock session) while that endpoint's
+    circuit is closed. New threads, and threads whose endpoint is unhealthy, are
+    routed by strategy: 'least_outstanding' picks the endpoint with the fewest calls
+    in flight relative to its weight, 'weighted' picks at random in proportion to the
+    weights. Endpoints whose circuit is open are skipped until their probe window.
+
+    Args:
+        endpoints: List of AgentEndpoint
+        strategy: 'least_outstanding' or 'weighted'
+    """
+
+    def __init__(self, endpoints, strategy='least_outstanding'):
+        if not endpoints:
+            raise ValueError("At least one agent endpoint is required")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}, expected one of {ROUTING_STRATEGIES}")
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self._by_name = {endpoint.name: endpoint for endpoint in self.endpoints}
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_json, default_agent_id, default_alias_id, strategy='least_outstanding',
+                    failure_threshold=5, open_seconds=30.0):
+        """
+        Build the pool from a JSON list of endpoints, or a single default endpoint
+
+        Each entry has agent_id, alias_id and optionally region, profile and weight, e.g.
+        [{"agent_id": "XZUYJQWY92", "alias_id": "EZMNLUBFHR", "weight": 2},
+         {"agent_id": "XZUYJQWY92", "alias_id": "EZMNLUBFHR", "region": "us-west-2"}]
+        """
+        entries = json.loads(config_json) if config_json else [{'agent_id': default_agent_id, 'alias_id': default_alias_id}]
+        endpoints = [
+            AgentEndpoint(
+                entry['agent_id'],
+                entry['alias_id'],
+                region=entry.get('region', 'us-east-1'),
+                profile=entry.get('profile', 'chatbot'),
+                weight=entry.get('weight', 1.0),
+                failure_threshold=failure_threshold,
+                open_seconds=open_seconds
+            )
+            for entry in entries
+        ]
+        return cls(endpoints, strategy)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def acquire(self, preferred=None, exclude=()):
+        """
+        Pick an endpoint for one call and count it as outstanding
+
+        Args:
+            preferred: Endpoint name the thread is bound to (kept while available)
+            exclude: Endpoint names already tried for this turn
+
+        Returns:
+            AgentEndpoint, or None when every endpoint has been tried
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.name not in exclude]
+            if not candidates:
+                return None
+            sticky = self._by_name.get(preferred)
+            if sticky is not None and sticky in candidates and sticky.available(now):
+                endpoint = sticky
+            else:
+                healthy = [endpoint for endpoint in candidates if endpoint.available(now)]
+                if not healthy:
+                    # Everything is open: probe the endpoint that opened first rather than fail outright
+                    endpoint = min(candidates, key=lambda candidate: candidate.opened_at)
+                elif self.strategy == 'weighted':
+                    endpoint = self._random.choices(healthy, [candidate.weight for candidate in healthy])[0]
+                else:
+                    endpoint = min(healthy, key=lambda candidate: ((candidate.outstanding + 1) / candidate.weight,
+                                                                   self._random.random()))
+            endpoint.begin()
+            return endpoint
+
+    def cache_identity(self):
+        """(agent ids, alias ids) identifying the pool in response cache keys"""
+        return (",".join(endpoint.agent_id for endpoint in self.endpoints),
+                ",".join(f"{endpoint.alias_id}@{endpoint.region}" for endpoint in self.endpoints))
+
+    def stats(self):
+        return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
@@ -0,0 +1,67 @@
+"""
+Benchmark serial vs parallel AST extraction on a synthetic repository
+
+Usage:
+    python -m benchmarks.bench_ast_extraction --files 5000 --workers 8
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import utils
+from utils import extract_classes_from_files
+
+
+# Write a synthetic Python package with the given number of modules
+def generate_synthetic_repo(root, file_count, classes_per_file=5, methods_per_class=8):
+    for index in range(file_count):
+        package_dir = os.path.join(root, f"pkg{index // 500}")
+        os.makedirs(package_dir, exist_ok=True)
+        lines = []
+        for class_index in range(classes_per_file):
+            lines.append(f"class Model{index}_{class_index}(Base):")
+            lines.append(f'    """Synthetic class {class_index} of module {index}."""')
+            for method_index in range(methods_per_class):
+                lines.append(f"    def method_{method_index}(self, value, *args):")
+                lines.append(f'        """Return value scaled by {method_index}."""')
+                lines.append(f"        return [value * {method_index} for _ in range(10)]")
+            lines.append("")
+        with open(os.path.join(package_dir, f"module_{index}.py"), 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel AST extraction")
+    parser.add_argument("--files", type=int, default=5000, help="Number of synthetic modules")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=64, help="Files per worker task")
+    args = parser.parse_args()
+
+    # Size of the shared process pool, created on the first parallel call
+    utils.PROCESS_POOL_WORKERS = args.workers
+    with tempfile.TemporaryDirectory() as root:
+        generate_synthetic_repo(root, args.files)
+        python_files = list(Path(root).rglob('*.py'))
+
+        start = time.perf_counter()
+        serial = extract_classes_from_files(python_files, max_workers=1)
+        serial_seconds = time.perf_counter() - start
+
+        # Start the pool's workers first: a running server keeps them between requests
+        extract_classes_from_files(python_files[:args.workers * args.batch_size], max_workers=args.workers,
+                                   batch_size=args.batch_size, min_files=0)
+        start = time.perf_counter()
+        parallel = extract_classes_from_files(python_files, max_workers=args.workers,
+                                              batch_size=args.batch_size, min_files=0)
+        parallel_seconds = time.perf_counter() - start
+
+    print(f"files: {len(python_files)}, workers: {args.workers}, batch size: {args.batch_size}")
+    print(f"serial:   {serial_seconds:.2f}s")
+    print(f"parallel: {parallel_seconds:.2f}s ({serial_seconds / parallel_seconds:.2f}x)")
+    print(f"identical results: {serial == parallel}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare peak memory of repository markdown generation strategies
+
+Usage:
+    python -m benchmarks.bench_markdown_memory --classes 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from utils import _read_markdown_file, generate_repo_markdown, write_repo_markdown
+
+
+# Previous implementation, kept as the baseline for output and memory comparison
+def legacy_generate_markdown(repo_name, repo_url, files_data):
+    md = f"# Repository: {repo_name}\n\n"
+    md += f"**Source:** {repo_url}\n\n"
+    md += "---\n\n"
+    md += "## Table of Contents\n\n"
+
+    for file_path, classes in files_data.items():
+        if classes:
+            md += f"- [{file_path}](#{file_path.replace('/', '').replace('.', '').replace('_', '-')})\n"
+            for cls in classes:
+                md += f"  - [{cls['name']}](#{cls['name'].lower()})\n"
+
+    md += "\n---\n\n"
+
+    for file_path, classes in files_data.items():
+        if not classes:
+            continue
+
+        md += f"## File: `{file_path}`\n\n"
+
+        for cls in classes:
+            md += f"### Class: `{cls['name']}`\n\n"
+            if cls['bases']:
+                md += f"**Inherits from:** {', '.join(cls['bases'])}\n\n"
+            if cls['docstring']:
+                md += f"**Description:**\n\n{cls['docstring']}\n\n"
+            if cls['methods']:
+                md += "**Methods:**\n\n"
+                for method in cls['methods']:
+                    args_str = ', '.join(method['args'])
+                    md += f"#### `{method['name']}({args_str})`\n\n"
+                    if method['docstring']:
+                        md += f"{method['docstring']}\n\n"
+                    else:
+                        md += "*No documentation available*\n\n"
+            md += "---\n\n"
+
+    return md
+
+
+# Build parsed repository data with the given total number of classes
+def synthetic_files_data(class_count, classes_per_file=10, methods_per_class=6):
+    files_data = {}
+    for index in range(class_count):
+        file_path = f"pkg{index // 5000}/module_{index // classes_per_file}.py"
+        files_data.setdefault(file_path, []).append({
+            'name': f"Model{index}",
+            'docstring': f"Synthetic model number {index} used for benchmarking.",
+            'bases': ['Base'],
+            'methods': [{
+                'name': f"method_{method_index}",
+                'docstring': '' if method_index % 3 else f"Return value scaled by {method_index}.",
+                'args': ['self', 'value']
+            } for method_index in range(methods_per_class)]
+        })
+    return files_data
+
+
+# Production path: stream into a file, then read the document back once
+def file_generate_markdown(repo_name, repo_url, files_data):
+    fd, path = tempfile.mkstemp(suffix='.md')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            write_repo_markdown(f, repo_name, repo_url, files_data)
+        return _read_markdown_file(path)
+    finally:
+        os.unlink(path)
+
+
+def measure(label, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {seconds:6.2f}s  peak {peak / (1024 * 1024):8.1f} MiB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark repository markdown generation memory")
+    parser.add_argument("--classes", type=int, default=50000, help="Number of synthetic classes")
+    args = parser.parse_args()
+
+    files_data = synthetic_files_data(args.classes)
+    args_tuple = ("synthetic", "https://github.com/example/synthetic", files_data)
+
+    legacy = measure("legacy", lambda: legacy_generate_markdown(*args_tuple))
+    joined = measure("string", lambda: generate_repo_markdown(*args_tuple))
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        measure("streamed", lambda: write_repo_markdown(devnull, *args_tuple))
+    from_file = measure("file", lambda: file_generate_markdown(*args_tuple))
+
+    print(f"identical output: {legacy == joined == from_file} ({len(joined)} characters)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Offline benchmark suite: the app's hot paths against local AWS stand-ins
+
+Runs generate_answer (through the compiled graph), convert_pdf_to_markdown and
+convert_github_repo_to_markdown on synthetic PDFs and git repositories, with
+Bedrock, S3 and bedrock-agent replaced by the stubs in benchmarks.stubs. Reports
+throughput and p50/p95/p99 latency and writes the results as JSON.
+
+Usage:
+    python -m benchmarks.bench_offline --iterations 30 --agent-latency-ms 300 --throttle-rate 0.05
+    python -m benchmarks.bench_offline --output new.json --baseline old.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+
+# Latency summary of a list of samples in seconds
+def summarize(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    if len(ordered) > 1:
+        cut_points = statistics.quantiles(ordered, n=100, method='inclusive')
+        p50, p95, p99 = cut_points[49], cut_points[94], cut_points[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        'min': ordered[0],
+        'mean': statistics.fmean(ordered),
+        'p50': p50,
+        'p95': p95,
+        'p99': p99,
+        'max': ordered[-1]
+    }
+
+
+# Time fn over several iterations; a call that raises or returns None counts as an error
+def run_benchmark(name, params, fn, iterations, warmup=1, concurrency=1):
+    for _ in range(warmup):
+        try:
+            fn()
+        except Exception:
+            pass
+
+    def timed_call(_):
+        start = time.perf_counter()
+        try:
+            ok = fn() is not None
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed_call, range(iterations)))
+    else:
+        outcomes = [timed_call(index) for index in range(iterations)]
+    wall_seconds = time.perf_counter() - start
+
+    latencies = [seconds for seconds, ok in outcomes if ok]
+    result = {
+        'name': name,
+        'params': params,
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'wall_seconds': wall_seconds,
+        'throughput_per_second': iterations / wall_seconds if wall_seconds else None,
+        'latency_seconds': summarize(latencies)
+    }
+    latency = result['latency_seconds']
+    print(f"{result_key(result):<60} p50 {latency.get('p50', 0) * 1000:8.1f}ms  "
+          f"p95 {latency.get('p95', 0) * 1000:8.1f}ms  p99 {latency.get('p99', 0) * 1000:8.1f}ms  "
+          f"{result['throughput_per_second']:7.2f}/s  errors {result['errors']}")
+    return result
+
+
+def result_key(result):
+    params = ",".join(f"{name}={value}" for name, value in sorted(result['params'].items()))
+    return f"{result['name']}[{params}]"
+
+
+def git_commit():
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return completed.stdout.strip() or None
+
+
+# Print latency and throughput changes against an earlier results file
+def compare_with_baseline(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result_key(result): result for result in json.load(f)['results']}
+
+    print(f"\nChange against {baseline_path} (negative latency is faster):")
+    for result in results:
+        key = result_key(result)
+        previous = baseline.get(key)
+        if previous is None or not previous['latency_seconds'] or not result['latency_seconds']:
+            continue
+        changes = []
+        for quantile in ('p50', 'p95', 'p99'):
+            before = previous['latency_seconds'][quantile]
+            after = result['latency_seconds'][quantile]
+            changes.append(f"{quantile} {(after - before) / before * 100:+6.1f}%")
+        before_rate = previous['throughput_per_second'] or 0
+        after_rate = result['throughput_per_second'] or 0
+        if before_rate:
+            changes.append(f"throughput {(after_rate - before_rate) / before_rate * 100:+6.1f}%")
+        print(f"{key:<60} " + "  ".join(changes))
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with stubbed AWS backends")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed calls per benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before each benchmark")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent generate_answer turns")
+    parser.add_argument("--agent-latency-ms", type=float, default=200, help="Stub agent latency per call")
+    parser.add_argument("--agent-jitter-ms", type=float, default=50, help="Random jitter added to agent latency")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of agent calls throttled")
+    parser.add_argument("--s3-latency-ms", type=float, default=30, help="Stub S3 latency per request")
+    parser.add_argument("--s3-throttle-rate", type=float, default=0.0, help="Fraction of S3 requests throttled")
+    parser.add_argument("--pdf-pages", type=parse_sizes, default=[5, 50], help="Comma-separated PDF page counts")
+    parser.add_argument("--repo-files", type=parse_sizes, default=[50, 500], help="Comma-separated repository module counts")
+    parser.add_argument("--repo-asset-mb", type=float, default=20, help="Binary assets (MiB) in each synthetic repository")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for stub jitter and throttling")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/offline-<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--log-level", default="ERROR", help="Application log level while benchmarking")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    with tempfile.TemporaryDirectory(prefix="chatbot-bench-") as work_dir:
+        # Every cache and database the app opens goes to the scratch directory
+        os.environ['PDF_CACHE_DIR'] = os.path.join(work_dir, 'pdf_cache')
+        os.environ['SAVED_REPO_DIR'] = os.path.join(work_dir, 'saved_repos')
+        os.environ['CHECKPOINT_DB_PATH'] = os.path.join(work_dir, 'checkpoints.sqlite')
+        os.environ['SAVE_QUEUE_DB_PATH'] = os.path.join(work_dir, 'save_jobs.sqlite')
+        os.environ['KB_MANIFEST_PATH'] = os.path.join(work_dir, 'kb_manifest.json')
+
+        from benchmarks.fixtures import generate_synthetic_git_repo, generate_synthetic_pdf
+        from benchmarks.stubs import LatencyProfile, StubAgentsRunnable, install_stubs
+
+        agent_latency = LatencyProfile(args.agent_latency_ms, args.agent_jitter_ms, args.throttle_rate, seed=args.seed)
+        stubs = install_stubs(
+            agent_latency=agent_latency,
+            s3_latency=LatencyProfile(args.s3_latency_ms, args.s3_latency_ms / 5, args.s3_throttle_rate, seed=args.seed),
+            ingestion_latency=LatencyProfile(args.s3_latency_ms, seed=args.seed)
+        )
+
+        import graph
+        import utils
+        from langchain_core.messages import HumanMessage
+
+        for endpoint in graph.agent_pool.endpoints:
+            endpoint.model = StubAgentsRunnable(agent_latency, endpoint.agent_id, endpoint.alias_id)
+        results = []
+
+        # convert_pdf_to_markdown: cold conversions and cache hits
+        pdf_paths = {}
+        for pages in args.pdf_pages:
+            pdf_paths[pages] = generate_synthetic_pdf(os.path.join(work_dir, f"synthetic-{pages}.pdf"), pages)
+            results.append(run_benchmark(
+                'convert_pdf_to_markdown', {'pages': pages, 'cache': 'cold'},
+                lambda path=pdf_paths[pages]: utils.convert_pdf_to_markdown(path, use_cache=False),
+                args.iterations, args.warmup
+            ))
+            results.append(run_benchmark(
+                'convert_pdf_to_markdown', {'pages': pages, 'cache': 'warm'},
+                lambda path=pdf_paths[pages]: utils.convert_pdf_to_markdown(path),
+                args.iterations, args.warmup
+            ))
+
+        # convert_github_repo_to_markdown: fresh clones (partial and full) and unchanged-SHA cache hits
+        for file_count in args.repo_files:
+            repo_url = generate_synthetic_git_repo(os.path.join(work_dir, f"repo-{file_count}"), file_count,
+                                                   asset_bytes=int(args.repo_asset_mb * 1024 * 1024))
+            clone_counter = iter(range(10 ** 9))
+            default_clone_mode = utils.REPO_CLONE_MODE
+            for clone_mode in ('partial', 'full'):
+                utils.REPO_CLONE_MODE = clone_mode
+                results.append(run_benchmark(
+                    'convert_github_repo_to_markdown',
+                    {'files': file_count, 'asset_mb': args.repo_asset_mb, 'cache': 'cold', 'clone': clone_mode},
+                    lambda url=repo_url, n=file_count: utils.convert_github_repo_to_markdown(
+                        url, temp_dir=os.path.join(work_dir, 'clones', f"{n}-{next(clone_counter)}")),
+                    args.iterations, args.warmup
+                ))
+            utils.REPO_CLONE_MODE = default_clone_mode
+
+            results.append(run_benchmark(
+                'convert_github_repo_to_markdown', {'files': file_count, 'cache': 'warm'},
+                lambda url=repo_url: utils.convert_github_repo_to_markdown(url),
+                args.iterations, args.warmup
+            ))
+
+            # The S3 leg of a "save" request, with the repository markdown as payload
+            markdown_text = utils.convert_github_repo_to_markdown(repo_url)
+            results.append(run_benchmark(
+                'upload_markdown_to_s3', {'files': file_count, 'kib': len(markdown_text.encode('utf-8')) // 1024},
+                lambda text=markdown_text, n=file_count: utils.upload_markdown_to_s3(text, f"repo-{n}"),
+                args.iterations, args.warmup
+            ))
+
+        # generate_answer through the compiled graph, one new conversation per turn
+        def run_turn(prompt, files=None):
+            thread_id = f"bench-{time.perf_counter_ns()}"
+            additional_kwargs = {'files': files} if files else {}
+            state = graph.flow.invoke(
+                {"messages": [HumanMessage(content=prompt, additional_kwargs=additional_kwargs)]},
+                {"configurable": {"thread_id": thread_id}}
+            )
+            return state["messages"][-1].content
+
+        results.append(run_benchmark(
+            'generate_answer', {'attachments': 0, 'throttle_rate': args.throttle_rate},
+            lambda: run_turn("How do I create a new REST API in the account service?"),
+            args.iterations, args.warmup, args.concurrency
+        ))
+        smallest_pdf = min(pdf_paths) if pdf_paths else None
+        if smallest_pdf is not None:
+            attachment = [{'path': pdf_paths[smallest_pdf], 'name': 'guide.pdf', 'mime': 'application/pdf'}]
+            results.append(run_benchmark(
+                'generate_answer', {'attachments': 1, 'pages': smallest_pdf, 'throttle_rate': args.throttle_rate},
+                lambda: run_turn("Summarize the deployment checklist in this guide", attachment),
+                args.iterations, args.warmup, args.concurrency
+            ))
+
+    report = {
+        'suite': 'offline',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {name: value for name, value in vars(args).items() if name not in ('output', 'baseline')},
+        'stubs': {'agent': agent_latency.stats(), 's3': stubs.s3.latency.stats()},
+        'results': results
+    }
+    output_path = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        f"offline-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
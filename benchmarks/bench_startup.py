@@ -0,0 +1,104 @@
+"""
+Measure cold-start time-to-ready of the app modules in fresh interpreters
+
+Each run starts a new Python process, imports the target module and reports how
+long the import took (for graph that includes compiling the flow; for chatbot it is
+the whole app as Chainlit loads it). --importtime lists the slowest imports.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 10 --importtime
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_offline import summarize
+
+
+TARGETS = ('utils', 'graph', 'chatbot')
+
+READY_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def child_env(work_dir):
+    env = dict(os.environ)
+    env.update({
+        'CHECKPOINT_DB_PATH': os.path.join(work_dir, 'checkpoints.sqlite'),
+        'SAVE_QUEUE_DB_PATH': os.path.join(work_dir, 'save_jobs.sqlite'),
+        'KB_MANIFEST_PATH': os.path.join(work_dir, 'kb_manifest.json'),
+        'PDF_CACHE_DIR': os.path.join(work_dir, 'pdf_cache'),
+        'METRICS_PORT': '0',
+        'PYTHONWARNINGS': 'ignore'
+    })
+    return env
+
+
+# Import the module in a new interpreter and return the seconds it took
+def time_import(module, env):
+    completed = subprocess.run(
+        [sys.executable, '-c', READY_SCRIPT.format(module=module)],
+        capture_output=True, text=True, env=env, timeout=300
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr.strip()}")
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+# Slowest modules by cumulative import time (python -X importtime)
+def slowest_imports(module, env, top):
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=env, timeout=300
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Keep the module and its direct imports; deeper ones are already in their cumulative time
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        if depth > 1:
+            continue
+        rows.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the app modules")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--modules", default=",".join(TARGETS), help="Comma-separated modules to import")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports")
+    parser.add_argument("--top", type=int, default=10, help="Imports listed with --importtime")
+    parser.add_argument("--output", help="Optional JSON results file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="chatbot-startup-") as work_dir:
+        env = child_env(work_dir)
+        for module in (name for name in args.modules.split(',') if name):
+            samples = [time_import(module, env) for _ in range(args.runs)]
+            results[module] = {'runs': args.runs, 'seconds': summarize(samples)}
+            seconds = results[module]['seconds']
+            print(f"import {module:<10} p50 {seconds['p50'] * 1000:8.1f}ms  "
+                  f"min {seconds['min'] * 1000:8.1f}ms  max {seconds['max'] * 1000:8.1f}ms")
+            if args.importtime:
+                results[module]['slowest_imports'] = slowest_imports(module, env, args.top)
+                for cumulative, name in results[module]['slowest_imports']:
+                    print(f"    {cumulative * 1000:8.1f}ms  {name}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Synthetic inputs for the benchmarks: PDFs and git repositories of a given size
+"""
+import os
+import subprocess
+
+from benchmarks.bench_ast_extraction import generate_synthetic_repo
+
+
+# Write a text PDF with the given number of pages
+def generate_synthetic_pdf(path, pages, paragraphs_per_page=6):
+    import pymupdf
+
+    document = pymupdf.open()
+    for page_index in range(pages):
+        page = document.new_page()
+        y = 72
+        page.insert_text((72, y), f"Section {page_index + 1}: Synthetic onboarding guide", fontsize=16)
+        for paragraph_index in range(paragraphs_per_page):
+            y += 90
+            text = (f"Paragraph {paragraph_index + 1} of page {page_index + 1} describes the account "
+                    f"service, its REST endpoints and the deployment checklist step {paragraph_index}. ") * 3
+            page.insert_textbox(pymupdf.Rect(72, y, 540, y + 84), text, fontsize=10)
+    document.save(path)
+    document.close()
+    return path
+
+
+# Create a git repository of synthetic Python modules and return its file:// URL
+def generate_synthetic_git_repo(root, file_count, classes_per_file=5, methods_per_class=8, asset_bytes=0):
+    """
+    asset_bytes adds that much incompressible binary data under assets/ (datasets,
+    images) that the app never parses. The repository serves partial clones.
+    """
+    generate_synthetic_repo(root, file_count, classes_per_file, methods_per_class)
+    if asset_bytes:
+        assets_dir = os.path.join(root, 'assets')
+        os.makedirs(assets_dir, exist_ok=True)
+        asset_size = 1024 * 1024
+        for index in range(0, asset_bytes, asset_size):
+            with open(os.path.join(assets_dir, f"asset_{index // asset_size}.bin"), 'wb') as f:
+                f.write(os.urandom(min(asset_size, asset_bytes - index)))
+    env = dict(os.environ, GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@example.com",
+               GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@example.com")
+    for command in (['git', 'init', '-q'], ['git', 'add', '-A'], ['git', 'commit', '-q', '-m', 'synthetic repository'],
+                    ['git', 'config', 'uploadpack.allowFilter', 'true'],
+                    ['git', 'config', 'uploadpack.allowAnySHA1InWant', 'true']):
+        subprocess.run(command, cwd=root, env=env, check=True, capture_output=True)
+    return f"file://{os.path.abspath(root)}"
@@ -0,0 +1,224 @@
+"""
+Load generator: simulated concurrent Chainlit users driving the compiled graph
+
+Each simulated user owns a thread_id and sends turns through flow.astream (as
+chatbot.py does) with a mix of plain, PDF and repository prompts, pausing for a
+think time between turns. The agent, S3 and bedrock-agent are stubbed (see
+benchmarks.stubs) and repository URLs resolve to a local synthetic repository.
+Concurrency ramps through the given levels; each level reports throughput, turn
+latency percentiles, event-loop lag and RSS growth.
+
+Usage:
+    python -m benchmarks.load_flow --users 1,10,25,50 --duration 30 --agent-latency-ms 800
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+from benchmarks.bench_offline import git_commit, parse_sizes, summarize
+
+
+# Current resident set size in bytes (peak RSS where /proc is unavailable)
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Sample how late the event loop wakes up from a fixed-interval sleep
+async def monitor_loop_lag(samples, stop, interval=0.05):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+# One simulated user: turns until the deadline, each on the user's own thread
+async def simulated_user(flow, user_index, deadline, turn_mix, pdf_paths, repo_url, think_seconds, records, rng):
+    from langchain_core.messages import HumanMessage
+
+    thread_id = f"load-{user_index}-{uuid.uuid4().hex[:8]}"
+    kinds, weights = zip(*turn_mix.items())
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        additional_kwargs = {}
+        if kind == 'pdf' and pdf_paths:
+            path = rng.choice(pdf_paths)
+            additional_kwargs['files'] = [{'path': path, 'name': os.path.basename(path), 'mime': 'application/pdf'}]
+            prompt = "Summarize the deployment checklist in this guide"
+        elif kind == 'repo':
+            prompt = f"Which classes handle scaling in {repo_url}?"
+        else:
+            prompt = f"How do I create a new REST API in the account service? (turn {len(records)})"
+
+        start = time.perf_counter()
+        first_token = None
+        ok = True
+        try:
+            async for mode, _ in flow.astream(
+                {"messages": [HumanMessage(content=prompt, additional_kwargs=additional_kwargs)]},
+                {"configurable": {"thread_id": thread_id}},
+                stream_mode=["custom", "values"]
+            ):
+                if mode == "custom" and first_token is None:
+                    first_token = time.perf_counter() - start
+        except Exception:
+            ok = False
+        records.append({'kind': kind, 'ok': ok, 'latency': time.perf_counter() - start, 'first_token': first_token})
+        await asyncio.sleep(rng.uniform(0, 2 * think_seconds))
+
+
+# Run one concurrency level and summarize it
+async def run_level(flow, users, duration, turn_mix, pdf_paths, repo_url, think_seconds, seed):
+    records = []
+    lag_samples = []
+    stop = asyncio.Event()
+    rss_before = current_rss_bytes()
+    monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        simulated_user(flow, index, deadline, turn_mix, pdf_paths, repo_url, think_seconds,
+                       records, random.Random(seed + index))
+        for index in range(users)
+    ))
+    wall_seconds = time.perf_counter() - start
+    stop.set()
+    await monitor
+    rss_after = current_rss_bytes()
+
+    completed = [record for record in records if record['ok']]
+    level = {
+        'users': users,
+        'wall_seconds': wall_seconds,
+        'turns': len(records),
+        'errors': len(records) - len(completed),
+        'throughput_per_second': len(completed) / wall_seconds,
+        'latency_seconds': summarize([record['latency'] for record in completed]),
+        'first_token_seconds': summarize([record['first_token'] for record in completed if record['first_token'] is not None]),
+        'latency_by_kind': {
+            kind: summarize([record['latency'] for record in completed if record['kind'] == kind])
+            for kind in turn_mix
+        },
+        'event_loop_lag_seconds': summarize(lag_samples),
+        'rss_before_bytes': rss_before,
+        'rss_after_bytes': rss_after,
+        'rss_growth_bytes': rss_after - rss_before
+    }
+    latency = level['latency_seconds']
+    lag = level['event_loop_lag_seconds']
+    print(f"users {users:>4}  turns {level['turns']:>5}  errors {level['errors']:>4}  "
+          f"{level['throughput_per_second']:7.2f} turns/s  "
+          f"p50 {latency.get('p50', 0) * 1000:8.1f}ms  p99 {latency.get('p99', 0) * 1000:8.1f}ms  "
+          f"loop lag p99 {lag.get('p99', 0) * 1000:6.1f}ms  "
+          f"rss {rss_after / 2 ** 20:7.1f}MiB ({(rss_after - rss_before) / 2 ** 20:+.1f})")
+    return level
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        mix[kind.strip()] = float(weight or 1)
+    unknown = set(mix) - {'plain', 'pdf', 'repo'}
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown turn kind(s): {', '.join(sorted(unknown))}")
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test against the compiled graph")
+    parser.add_argument("--users", type=parse_sizes, default=[1, 5, 10, 25, 50], help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level")
+    parser.add_argument("--think-seconds", type=float, default=1.0, help="Mean pause between a user's turns")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("plain=6,pdf=3,repo=1"), help="Turn mix, e.g. plain=6,pdf=3,repo=1")
+    parser.add_argument("--agent-latency-ms", type=float, default=800, help="Stub agent latency per call")
+    parser.add_argument("--agent-jitter-ms", type=float, default=400, help="Random jitter added to agent latency")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of agent calls throttled")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="Pages per synthetic PDF")
+    parser.add_argument("--pdf-variants", type=int, default=3, help="Distinct PDFs the users attach")
+    parser.add_argument("--repo-files", type=int, default=100, help="Modules in the synthetic repository")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for turn mix, think time and stub jitter")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--log-level", default="ERROR", help="Application log level during the run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    with tempfile.TemporaryDirectory(prefix="chatbot-load-") as work_dir:
+        os.environ['PDF_CACHE_DIR'] = os.path.join(work_dir, 'pdf_cache')
+        os.environ['SAVED_REPO_DIR'] = os.path.join(work_dir, 'saved_repos')
+        os.environ['CHECKPOINT_DB_PATH'] = os.path.join(work_dir, 'checkpoints.sqlite')
+        os.environ['SAVE_QUEUE_DB_PATH'] = os.path.join(work_dir, 'save_jobs.sqlite')
+        os.environ['KB_MANIFEST_PATH'] = os.path.join(work_dir, 'kb_manifest.json')
+
+        from benchmarks.fixtures import generate_synthetic_git_repo, generate_synthetic_pdf
+        from benchmarks.stubs import LatencyProfile, StubAgentsRunnable, install_stubs
+
+        agent_latency = LatencyProfile(args.agent_latency_ms, args.agent_jitter_ms, args.throttle_rate, seed=args.seed)
+        install_stubs(agent_latency=agent_latency)
+
+        import graph
+        import utils
+
+        for endpoint in graph.agent_pool.endpoints:
+            endpoint.model = StubAgentsRunnable(agent_latency, endpoint.agent_id, endpoint.alias_id)
+
+        pdf_paths = []
+        if args.mix.get('pdf'):
+            pdf_paths = [
+                generate_synthetic_pdf(os.path.join(work_dir, f"guide-{index}.pdf"), args.pdf_pages + index)
+                for index in range(args.pdf_variants)
+            ]
+        repo_url = "https://github.com/example/synthetic-repo"
+        if args.mix.get('repo'):
+            # GitHub URLs in prompts resolve to a local repository instead of the network
+            local_url = generate_synthetic_git_repo(os.path.join(work_dir, 'synthetic-repo'), args.repo_files)
+            graph.convert_github_repo_to_markdown = lambda url: utils.convert_github_repo_to_markdown(local_url)
+
+        # All levels share one event loop, as in the Chainlit server
+        async def ramp():
+            return [
+                await run_level(graph.flow, users, args.duration, args.mix, pdf_paths, repo_url,
+                                args.think_seconds, args.seed)
+                for users in args.users
+            ]
+
+        rss_start = current_rss_bytes()
+        levels = asyncio.run(ramp())
+
+    report = {
+        'suite': 'load',
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'cpu_count': os.cpu_count(),
+        'config': {name: value for name, value in vars(args).items() if name != 'output'},
+        'agent_calls': agent_latency.stats(),
+        'rss_start_bytes': rss_start,
+        'levels': levels
+    }
+    output_path = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results',
+        f"load-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
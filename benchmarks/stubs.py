@@ -0,0 +1,225 @@
+"""
+Local stand-ins for the AWS clients used by the app, for offline benchmarks
+
+Each stub sleeps for a configurable latency (plus jitter) per call and can fail a
+fraction of calls with ThrottlingException, so the app's code paths run unchanged
+without credentials or network access.
+"""
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+
+# Per-call latency and throttling behaviour of a stubbed service
+class LatencyProfile:
+    """
+    Args:
+        latency_ms: Base latency of every call in milliseconds
+        jitter_ms: Uniform random jitter added to the base latency
+        throttle_rate: Fraction of calls (0-1) failing with ThrottlingException
+        seed: Seed for the jitter/throttling random generator
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, throttle_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, operation_name):
+        """Sleep for one call's latency, then raise ThrottlingException if this call is throttled"""
+        from botocore.exceptions import ClientError
+
+        with self._lock:
+            self.calls += 1
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+        time.sleep(delay)
+        if throttled:
+            raise ClientError({
+                'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'},
+                'ResponseMetadata': {'HTTPStatusCode': 429}
+            }, operation_name)
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'throttled': self.throttled}
+
+
+# Text the stubbed agent answers with, split into streaming chunks
+def _agent_reply(input_text, response_chars, chunk_count):
+    text = (f"Stubbed answer to a {len(input_text)}-character prompt. " * (response_chars // 40 + 1))[:response_chars]
+    size = max(1, len(text) // chunk_count)
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+# bedrock-agent-runtime client: invoke_agent with a streamed completion
+class StubAgentRuntimeClient:
+    def __init__(self, latency, response_chars=800, chunk_count=8):
+        self.latency = latency
+        self.response_chars = response_chars
+        self.chunk_count = chunk_count
+
+    def invoke_agent(self, agentId, agentAliasId, sessionId, inputText, **kwargs):
+        self.latency.wait('InvokeAgent')
+        chunks = _agent_reply(inputText, self.response_chars, self.chunk_count)
+        return {
+            'sessionId': sessionId,
+            'completion': ({'chunk': {'bytes': chunk.encode('utf-8')}} for chunk in chunks)
+        }
+
+
+# BedrockAgentsRunnable replacement for the non-streaming invoke path
+class StubAgentsRunnable:
+    def __init__(self, latency, agent_id='STUBAGENT', agent_alias_id='STUBALIAS', response_chars=800):
+        self.latency = latency
+        self.agent_id = agent_id
+        self.agent_alias_id = agent_alias_id
+        self.response_chars = response_chars
+
+    def invoke(self, inputs, config=None):
+        self.latency.wait('InvokeAgent')
+        output = ''.join(_agent_reply(inputs['input'], self.response_chars, 1))
+        return SimpleNamespace(return_values={'output': output}, session_id=inputs.get('session_id'))
+
+
+# S3 client keeping object sizes and metadata in memory
+class StubS3Client:
+    """
+    Args:
+        latency: LatencyProfile applied once per request
+        bandwidth_mb_per_second: Simulated upload bandwidth (None for unlimited)
+    """
+
+    def __init__(self, latency, bandwidth_mb_per_second=None):
+        self.latency = latency
+        self.bandwidth_mb_per_second = bandwidth_mb_per_second
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def _store(self, bucket, key, size, extra_args):
+        extra_args = extra_args or {}
+        if self.bandwidth_mb_per_second:
+            time.sleep(size / (self.bandwidth_mb_per_second * 1024 * 1024))
+        with self._lock:
+            self.objects[(bucket, key)] = {
+                'ContentLength': size,
+                'ContentType': extra_args.get('ContentType', 'binary/octet-stream'),
+                'Metadata': dict(extra_args.get('Metadata', {})),
+                'LastModified': datetime.now(timezone.utc)
+            }
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.latency.wait('PutObject')
+        size = 0
+        for block in iter(lambda: Fileobj.read(1024 * 1024), b''):
+            size += len(block)
+        self._store(Bucket, Key, size, ExtraArgs)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        with open(Filename, 'rb') as f:
+            self.upload_fileobj(f, Bucket, Key, ExtraArgs=ExtraArgs, Config=Config)
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self.latency.wait('PutObject')
+        body = Body.encode('utf-8') if isinstance(Body, str) else Body
+        extra_args = {'ContentType': kwargs.get('ContentType'), 'Metadata': kwargs.get('Metadata', {})}
+        self._store(Bucket, Key, len(body), extra_args)
+        return {'ETag': f'"{uuid.uuid4().hex}"'}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        from botocore.exceptions import ClientError
+
+        self.latency.wait('HeadObject')
+        with self._lock:
+            entry = self.objects.get((Bucket, Key))
+        if entry is None:
+            raise ClientError({
+                'Error': {'Code': '404', 'Message': 'Not Found'},
+                'ResponseMetadata': {'HTTPStatusCode': 404}
+            }, 'HeadObject')
+        return dict(entry)
+
+
+# bedrock-agent client: ingestion jobs that complete after a fixed duration
+class StubBedrockAgentClient:
+    def __init__(self, latency, ingestion_seconds=1.0):
+        self.latency = latency
+        self.ingestion_seconds = ingestion_seconds
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def start_ingestion_job(self, knowledgeBaseId, dataSourceId, **kwargs):
+        self.latency.wait('StartIngestionJob')
+        job_id = uuid.uuid4().hex[:10].upper()
+        with self._lock:
+            self.jobs[job_id] = (knowledgeBaseId, dataSourceId, time.time())
+        return {'ingestionJob': {'ingestionJobId': job_id, 'knowledgeBaseId': knowledgeBaseId,
+                                 'dataSourceId': dataSourceId, 'status': 'STARTING'}}
+
+    def get_ingestion_job(self, knowledgeBaseId, dataSourceId, ingestionJobId, **kwargs):
+        self.latency.wait('GetIngestionJob')
+        with self._lock:
+            started = self.jobs.get(ingestionJobId, (None, None, 0))[2]
+        done = time.time() - started >= self.ingestion_seconds
+        return {'ingestionJob': {
+            'ingestionJobId': ingestionJobId,
+            'knowledgeBaseId': knowledgeBaseId,
+            'dataSourceId': dataSourceId,
+            'status': 'COMPLETE' if done else 'IN_PROGRESS',
+            'statistics': {'numberOfDocumentsScanned': 1, 'numberOfNewDocumentsIndexed': int(done),
+                           'numberOfModifiedDocumentsIndexed': 0, 'numberOfDocumentsFailed': 0}
+        }}
+
+    def list_ingestion_jobs(self, knowledgeBaseId, dataSourceId, filters=(), sortBy=None, maxResults=100, **kwargs):
+        self.latency.wait('ListIngestionJobs')
+        now = time.time()
+        with self._lock:
+            jobs = [(job_id, started) for job_id, (kb_id, ds_id, started) in self.jobs.items()
+                    if (kb_id, ds_id) == (knowledgeBaseId, dataSourceId)]
+        summaries = [{
+            'ingestionJobId': job_id,
+            'knowledgeBaseId': knowledgeBaseId,
+            'dataSourceId': dataSourceId,
+            'status': 'COMPLETE' if now - started >= self.ingestion_seconds else 'IN_PROGRESS',
+            'startedAt': datetime.fromtimestamp(started, timezone.utc)
+        } for job_id, started in jobs]
+        for item in filters:
+            if item.get('attribute') == 'STATUS':
+                summaries = [summary for summary in summaries if summary['status'] in item['values']]
+        summaries.sort(key=lambda summary: summary['startedAt'], reverse=(sortBy or {}).get('order') != 'ASCENDING')
+        return {'ingestionJobSummaries': summaries[:maxResults]}
+
+
+def install_stubs(agent_latency=None, s3_latency=None, ingestion_latency=None, ingestion_seconds=1.0,
+                  s3_bandwidth_mb_per_second=None, profile_name='chatbot', region_name='us-east-1'):
+    """
+    Register stub clients in the utils client registry
+
+    graph's agent endpoints build their clients through get_boto3_client on first use
+    and then pick up the stub. Set each endpoint's model (graph.agent_pool.endpoints)
+    to a StubAgentsRunnable for the non-streaming path.
+
+    Returns:
+        SimpleNamespace: The installed stubs (agent_runtime, s3, bedrock_agent)
+    """
+    import utils
+
+    stubs = SimpleNamespace(
+        agent_runtime=StubAgentRuntimeClient(agent_latency or LatencyProfile()),
+        s3=StubS3Client(s3_latency or LatencyProfile(), s3_bandwidth_mb_per_second),
+        bedrock_agent=StubBedrockAgentClient(ingestion_latency or LatencyProfile(), ingestion_seconds)
+    )
+    with utils._boto3_lock:
+        utils._boto3_clients[(profile_name, region_name, 'bedrock-agent-runtime')] = stubs.agent_runtime
+        utils._boto3_clients[(profile_name, region_name, 's3')] = stubs.s3
+        utils._boto3_clients[(profile_name, region_name, 'bedrock-agent')] = stubs.bedrock_agent
+    return stubs
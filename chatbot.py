@@ -1,8 +1,20 @@
+import asyncio
+import os
 import chainlit as cl
-from graph import flow  # Import the compiled LangGraph workflow
+from graph import flow, save_queue  # Import the compiled LangGraph workflow
+from metrics import configure_logging, start_metrics_server
+from save_queue import SaveJobQueue
 from chainlit.input_widget import Select, Switch, Slider
 from langchain_core.messages import HumanMessage
 
+# Structured JSON logs on stderr and Prometheus metrics on METRICS_PORT (0 disables the endpoint).
+# Each worker process takes the first free port of METRICS_PORT..METRICS_PORT+METRICS_PORT_SPAN-1.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))
+METRICS_PORT_SPAN = int(os.environ.get("METRICS_PORT_SPAN", "16"))
+configure_logging()
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT, port_span=METRICS_PORT_SPAN)
+
 # Define the starters
 @cl.set_starters
 def set_starters():
@@ -46,10 +58,42 @@ async def main(message: cl.Message):
             additional_kwargs['files'] = files
     
     input_message = HumanMessage(content=message.content, additional_kwargs=additional_kwargs)
-    final_state = flow.invoke({"messages" : [input_message]}, config)
-    content = final_state["messages"][-1].content
 
-    # Send a response back to the user
-    await cl.Message(
-        content
-    ).send()
\ No newline at end of file
+    # Stream agent chunks into the reply as they arrive; "values" yields the final state
+    response_message = cl.Message(content="")
+    final_state = None
+    async for mode, chunk in flow.astream({"messages" : [input_message]}, config, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            await response_message.stream_token(chunk)
+        else:
+            final_state = chunk
+
+    # Send a response back to the user (non-streamed replies arrive only in the final state)
+    if not response_message.content:
+        response_message.content = final_state["messages"][-1].content
+    await response_message.send()
+
+    # Follow queued save jobs and post their progress into this thread
+    for job_id in final_state.get("save_job_ids", []):
+        task = asyncio.create_task(report_save_job(job_id))
+        save_job_reporters.add(task)
+        task.add_done_callback(save_job_reporters.discard)
+
+# The event loop keeps only weak references to tasks; hold the running reporters here
+save_job_reporters = set()
+
+# Poll a background save job and post each status change as a message
+async def report_save_job(job_id, poll_seconds=2, timeout_seconds=3600):
+    last_detail = None
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_seconds
+    while loop.time() < deadline:
+        job = await asyncio.to_thread(save_queue.get, job_id)
+        if job is None:
+            return
+        if job["detail"] != last_detail:
+            last_detail = job["detail"]
+            await cl.Message(content=f"[{job['name']}] {job['detail']}").send()
+        if job["status"] in SaveJobQueue.TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(poll_seconds)
\ No newline at end of file
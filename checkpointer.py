@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+logger = logging.getLogger(__name__)
+
+
+# Durable, bounded SQLite checkpointer shared by every Chainlit worker on the node
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver with WAL mode, async support and bounded storage
+
+    The database runs in WAL mode with a busy timeout, so several worker processes can
+    share one file. Each put keeps only the newest max_checkpoints_per_thread checkpoints
+    of the thread (and their pending writes). Every maintenance_interval puts, threads
+    idle for longer than max_idle_seconds are deleted and the file is compacted (free
+    pages released, WAL truncated). The async methods run the sync
+    implementation in a worker thread so the saver works with flow.ainvoke/astream.
+
+    Args:
+        conn: sqlite3 connection created with check_same_thread=False
+        max_checkpoints_per_thread: Checkpoints kept per thread and namespace
+        max_idle_seconds: Idle time after which a thread is evicted (None disables eviction)
+        maintenance_interval: Number of puts between maintenance runs (eviction and compaction)
+    """
+
+    def __init__(self, conn, *, max_checkpoints_per_thread=20, max_idle_seconds=7 * 24 * 3600,
+                 maintenance_interval=200, serde=None):
+        super().__init__(conn, serde=serde)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.max_idle_seconds = max_idle_seconds
+        self.maintenance_interval = maintenance_interval
+        self._put_count = 0
+
+    @classmethod
+    def from_path(cls, path, busy_timeout_seconds=30, **kwargs):
+        """Open (or create) the checkpoint database at path"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=busy_timeout_seconds)
+        return cls(conn, **kwargs)
+
+    def setup(self):
+        if self.is_setup:
+            return
+        # auto_vacuum only takes effect on a new database, before any table exists
+        self.conn.executescript(
+            """
+            PRAGMA auto_vacuum=INCREMENTAL;
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            """
+        )
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_updated_at ON thread_activity (updated_at);
+            """
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (thread_id, time.time())
+            )
+            self._prune_thread(cur, thread_id, checkpoint_ns)
+
+        self._put_count += 1
+        if self._put_count % self.maintenance_interval == 0:
+            if self.max_idle_seconds is not None:
+                self.evict_idle_threads(self.max_idle_seconds)
+            # The checkpoint is already stored; a busy database only delays compaction
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                logger.warning(f"Checkpoint compaction failed: {e}")
+        return next_config
+
+    def _prune_thread(self, cur, thread_id, checkpoint_ns):
+        # Checkpoint ids are time-ordered, so the newest ones sort last
+        cur.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?)",
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints_per_thread)
+        )
+        if cur.rowcount:
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ("
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)",
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns)
+            )
+
+    def evict_idle_threads(self, max_idle_seconds):
+        """
+        Delete every thread whose last checkpoint is older than max_idle_seconds
+
+        Returns:
+            int: Number of evicted threads
+        """
+        cutoff = time.time() - max_idle_seconds
+        with self.cursor() as cur:
+            cur.execute("SELECT thread_id FROM thread_activity WHERE updated_at < ?", (cutoff,))
+            thread_ids = [row[0] for row in cur.fetchall()]
+            for thread_id in thread_ids:
+                cur.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+        if thread_ids:
+            logger.info(f"Evicted {len(thread_ids)} idle checkpoint thread(s)")
+        return len(thread_ids)
+
+    def delete_thread(self, thread_id):
+        super().delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM thread_activity WHERE thread_id = ?", (str(thread_id),))
+
+    def compact(self):
+        """Apply the retention limit to every thread, then release free pages and truncate the WAL"""
+        with self.cursor() as cur:
+            cur.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints")
+            for thread_id, checkpoint_ns in cur.fetchall():
+                self._prune_thread(cur, thread_id, checkpoint_ns)
+        with self.cursor() as cur:
+            cur.execute("PRAGMA incremental_vacuum")
+            cur.fetchall()
+            cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            cur.fetchall()
+
+    # Async API: run the sync implementation off the event loop
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
@@ -1,16 +1,38 @@
 import argparse
 from langgraph.graph import StateGraph, MessagesState
 #from langchain_aws import ChatBedrockConverse
-from langgraph.checkpoint.memory import MemorySaver
-from utils import save_graph_to_file, convert_pdf_to_markdown, upload_markdown_and_sync_kb, detect_github_url, convert_github_repo_to_markdown
-from langchain_aws.agents import BedrockAgentsRunnable
-import chainlit as cl
+from checkpointer import BoundedSqliteSaver
+from save_queue import SaveJobQueue
+from agent_limiter import AgentThrottledError, LimiterPool, is_capacity_error
+from agent_pool import AgentEndpointPool
+from metrics import current_thread_id, stage_span
+from utils import save_graph_to_file, convert_pdf_to_markdown, detect_github_url, convert_github_repo_to_markdown, find_unchanged_document, ThreadIndexStore, ResponseCache, ingestion_coalescer
+from langchain_core.runnables import RunnableLambda
+from langgraph.config import get_stream_writer
 import asyncio
+import contextvars
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import threading
+import time
+import uuid
 
 
+logger = logging.getLogger(__name__)
 
-# Create the memory checkpointer
-memory = MemorySaver()
+# Create the checkpointer: a SQLite file (WAL mode) shared by all workers on the node,
+# keeping a bounded number of checkpoints per thread and evicting idle threads
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH", os.path.join(os.path.expanduser("~"), ".cache", "chatbot", "checkpoints.sqlite"))
+CHECKPOINT_MAX_PER_THREAD = int(os.environ.get("CHECKPOINT_MAX_PER_THREAD", "20"))
+CHECKPOINT_MAX_IDLE_SECONDS = float(os.environ.get("CHECKPOINT_MAX_IDLE_SECONDS", str(7 * 24 * 3600)))
+memory = BoundedSqliteSaver.from_path(
+    CHECKPOINT_DB_PATH,
+    max_checkpoints_per_thread=CHECKPOINT_MAX_PER_THREAD,
+    max_idle_seconds=CHECKPOINT_MAX_IDLE_SECONDS
+)
 
 # Create the model
 # model = ChatBedrockConverse(
@@ -21,20 +43,29 @@ memory = MemorySaver()
 #     credentials_profile_name="chatbot"
 # )
 
-import boto3
-
 #client = boto3.client("bedrock-agent-runtime", region_name="us-east-1", profile_name="chatbot")
 
-# Create a session with your profile
-session = boto3.Session(profile_name="chatbot", region_name="us-east-1")
-
-# Use that session to create the client
-client = session.client("bedrock-agent-runtime")
+# Bedrock agent used for answers. The client and runnable are built on first use, so
+# importing this module (every Chainlit worker boot and -w reload) does not load
+# langchain_aws or the boto3 service model.
+BEDROCK_AGENT_ID = os.environ.get("BEDROCK_AGENT_ID", "XZUYJQWY92")
+BEDROCK_AGENT_ALIAS_ID = os.environ.get("BEDROCK_AGENT_ALIAS_ID", "EZMNLUBFHR")
 
-model = BedrockAgentsRunnable(
-    agent_id="XZUYJQWY92",
-    agent_alias_id="EZMNLUBFHR",
-    client=client
+# Pool of agent endpoints (agent, alias, region) sharing the load. BEDROCK_AGENT_ENDPOINTS
+# is a JSON list of {"agent_id", "alias_id", "region", "profile", "weight"}; when unset the
+# pool holds only the agent above. A thread sticks to its endpoint (its session lives
+# there) and moves on only when that endpoint's circuit breaker opens.
+BEDROCK_AGENT_ENDPOINTS = os.environ.get("BEDROCK_AGENT_ENDPOINTS", "")
+BEDROCK_ROUTING_STRATEGY = os.environ.get("BEDROCK_ROUTING_STRATEGY", "least_outstanding")
+BEDROCK_ENDPOINT_FAILURE_THRESHOLD = int(os.environ.get("BEDROCK_ENDPOINT_FAILURE_THRESHOLD", "5"))
+BEDROCK_ENDPOINT_OPEN_SECONDS = float(os.environ.get("BEDROCK_ENDPOINT_OPEN_SECONDS", "30"))
+agent_pool = AgentEndpointPool.from_config(
+    BEDROCK_AGENT_ENDPOINTS,
+    BEDROCK_AGENT_ID,
+    BEDROCK_AGENT_ALIAS_ID,
+    strategy=BEDROCK_ROUTING_STRATEGY,
+    failure_threshold=BEDROCK_ENDPOINT_FAILURE_THRESHOLD,
+    open_seconds=BEDROCK_ENDPOINT_OPEN_SECONDS
 )
 
 
@@ -46,152 +77,566 @@ model = BedrockAgentsRunnable(
 # )
 
 
+# Client-side flow control for agent calls, one limiter per agent endpoint: callers wait
+# in a fair queue for a slot, the number of slots adapts (AIMD) to throttling, an
+# optional token bucket caps the request rate, and throttled calls are retried
+MAX_CONCURRENT_AGENT_CALLS = int(os.environ.get("BEDROCK_MAX_CONCURRENT_CALLS", "4"))
+AGENT_MIN_CONCURRENT_CALLS = int(os.environ.get("BEDROCK_MIN_CONCURRENT_CALLS", "1"))
+AGENT_MAX_CONCURRENT_CALLS_CEILING = int(os.environ.get("BEDROCK_MAX_CONCURRENT_CALLS_CEILING", "16"))
+AGENT_RATE_PER_SECOND = float(os.environ.get("BEDROCK_AGENT_RATE_PER_SECOND", "0"))
+AGENT_RATE_BURST = float(os.environ.get("BEDROCK_AGENT_RATE_BURST", "0")) or None
+AGENT_RETRY_MAX_ATTEMPTS = int(os.environ.get("BEDROCK_RETRY_MAX_ATTEMPTS", "4"))
+AGENT_RETRY_BASE_SECONDS = float(os.environ.get("BEDROCK_RETRY_BASE_SECONDS", "0.5"))
+AGENT_RETRY_MAX_SECONDS = float(os.environ.get("BEDROCK_RETRY_MAX_SECONDS", "20"))
+AGENT_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("BEDROCK_QUEUE_TIMEOUT_SECONDS", "60"))
+agent_limiters = LimiterPool(
+    initial_limit=MAX_CONCURRENT_AGENT_CALLS,
+    min_limit=AGENT_MIN_CONCURRENT_CALLS,
+    max_limit=AGENT_MAX_CONCURRENT_CALLS_CEILING,
+    rate_per_second=AGENT_RATE_PER_SECOND,
+    burst=AGENT_RATE_BURST,
+    max_attempts=AGENT_RETRY_MAX_ATTEMPTS,
+    base_delay_seconds=AGENT_RETRY_BASE_SECONDS,
+    max_delay_seconds=AGENT_RETRY_MAX_SECONDS,
+    queue_timeout_seconds=AGENT_QUEUE_TIMEOUT_SECONDS
+)
+# Reply used when the agent stays throttled after all retries
+AGENT_BUSY_MESSAGE = "The assistant is handling too many requests right now. Please try again in a moment."
+
+# Stream agent output chunk by chunk (flow.astream with stream_mode="custom")
+STREAM_AGENT_RESPONSES = os.environ.get("BEDROCK_STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Local retrieval over attached documents: only the top-k chunks relevant to the
+# question (within a character budget) are sent to the agent
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_CHAR_BUDGET = int(os.environ.get("RETRIEVAL_CHAR_BUDGET", "12000"))
+RETRIEVAL_CHUNK_CHARS = int(os.environ.get("RETRIEVAL_CHUNK_CHARS", "1500"))
+RETRIEVAL_MAX_THREADS = int(os.environ.get("RETRIEVAL_MAX_THREADS", "256"))
+thread_indexes = ThreadIndexStore(RETRIEVAL_MAX_THREADS, RETRIEVAL_CHUNK_CHARS)
+
+# Opt-in cache of agent answers for attachment-free prompts (e.g. the starters);
+# cleared whenever a knowledge base ingestion job completes
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+response_cache = ResponseCache(RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MAX_ENTRIES) if RESPONSE_CACHE_ENABLED else None
+
+def _invalidate_response_cache(job):
+    if response_cache is not None and job.get("status") == "COMPLETE":
+        response_cache.clear()
+        logger.info(">> Knowledge base updated - response cache cleared")
+
+ingestion_coalescer.add_listener(_invalidate_response_cache)
+
+# One Bedrock agent session per Chainlit thread. Sessions idle longer than the agent's
+# idleSessionTTLInSeconds (600 by default) have expired server-side and are replaced.
+AGENT_SESSION_IDLE_TTL_SECONDS = float(os.environ.get("AGENT_SESSION_IDLE_TTL_SECONDS", "600"))
+AGENT_SESSION_MAX_AGE_SECONDS = float(os.environ.get("AGENT_SESSION_MAX_AGE_SECONDS", str(24 * 3600)))
+
+# Background queue for "save" requests; queued jobs survive a restart of the web process
+SAVE_QUEUE_DB_PATH = os.environ.get("SAVE_QUEUE_DB_PATH", os.path.join(os.path.expanduser("~"), ".cache", "chatbot", "save_jobs.sqlite"))
+SAVE_QUEUE_WORKERS = int(os.environ.get("SAVE_QUEUE_WORKERS", "2"))
+save_queue = SaveJobQueue(SAVE_QUEUE_DB_PATH, workers=SAVE_QUEUE_WORKERS)
+save_queue.start()
+
+# Maximum number of attachments/repositories converted concurrently within one turn
+PREPROCESS_FANOUT = int(os.environ.get("PREPROCESS_FANOUT", "4"))
+# Conversions (PDFs, repository clones) of all turns in the process share this pool, so
+# long clones queue here instead of filling the event loop's default executor that
+# checkpoint I/O and agent calls run on
+CONVERSION_MAX_WORKERS = int(os.environ.get("CONVERSION_MAX_WORKERS", "4"))
+conversion_executor = ThreadPoolExecutor(max_workers=CONVERSION_MAX_WORKERS, thread_name_prefix="conversion")
+
 # Helper function to send loading message
 async def send_loading_message(message: str):
     """Send a loading message to Chainlit UI"""
+    import chainlit as cl
+
     try:
         msg = cl.Message(content=message)
         await msg.send()
     except Exception as e:
-        print(f"Could not send loading message: {e}")
+        logger.warning(f"Could not send loading message: {e}")
 
 # Define the function that generates the assistant response
 # def generate_answer(state: MessagesState):
 #     return {"messages": [model.invoke(state["messages"])]}
-# --- Node function ---
-def generate_answer(state: MessagesState):
-    user_messages = state["messages"]
-    last_message = user_messages[-1]
-    
-    # Check for PDF files in the message and convert to markdown
-    pdf_markdown_content = []
-    
-    # Check for GitHub URLs in the message and convert to markdown
-    github_markdown_content = []
-    
-   
+# --- Node helpers ---
+# State update for a turn answered by queueing a background save job
+def _save_queued_update(name, job_id):
+    logger.info(f">> Save job {job_id} queued for {name}")
+    return {
+        "messages": [f"Saving {name} to the knowledge base in the background. I'll post progress updates here."],
+        "save_job_ids": [job_id]
+    }
+
+# State update for a save request whose content is already in the knowledge base
+def _already_saved_update(name, s3_uri):
+    logger.info(f">> {name} unchanged since the last save ({s3_uri}), nothing to upload")
+    return {
+        "messages": [f"{name} is already up to date in the knowledge base - nothing to upload."],
+        "save_job_ids": []
+    }
+
+# Attachments (PDF files) and GitHub URLs to convert for this turn, in message order
+def _collect_conversion_tasks(last_message):
+    tasks = []
     if hasattr(last_message, 'additional_kwargs') and 'files' in last_message.additional_kwargs:
         files = last_message.additional_kwargs['files']
         for file_info in files:
             if isinstance(file_info, dict) and 'path' in file_info:
                 file_path = file_info['path']
                 if file_path.lower().endswith('.pdf'):
-                        print(f">> Detected PDF file: {file_path}")
-                        markdown_text = convert_pdf_to_markdown(file_path)
-                        if markdown_text:
-                            file_name = file_info.get('name', 'Unknown PDF')
-                            pdf_markdown_content.append({
-                                'file_name': file_name,
-                                'content': markdown_text
-                            })
-                            print(f">> PDF converted to markdown: {file_name}")
-                            
-                            # Upload markdown to S3 and sync knowledge base only if message contains save keywords
-                            message_lower = last_message.content.lower() if last_message.content else ""
-                            if "save" in message_lower or "save file" in message_lower:
-                                knowledge_base_id = 'KALBYLJM4N'
-                                data_source_id = 'DFG01BWHSR'
-                                print(f">> 'Save file' detected - uploading to S3 and syncing knowledge base")
-                                result = upload_markdown_and_sync_kb(
-                                    markdown_text, 
-                                    file_name, 
-                                    knowledge_base_id, 
-                                    data_source_id
-                                )
-                                if result:
-                                    print(f">> Successfully uploaded and synced: {result['s3_uri']}")
-                                    return {"messages": [ f"Successfully uploaded and synced: {result['s3_uri']}"]}
-                                else:
-                                    print(f">> Warning: Upload/sync failed for {file_name}")
-                                    return {"messages": [ f"Failed to upload and sync: {file_name}"]}
-                            else:
-                                print(f">> PDF converted but not saved (no 'save file' keyword in message)")
+                    logger.info(f">> Detected PDF file: {file_path}")
+                    tasks.append(('pdf', file_info))
     
     # Check for GitHub URLs in the message content
     message_content_text = last_message.content if last_message.content else ""
     github_urls = detect_github_url(message_content_text)
-    
     if github_urls:
-        print(f">> Detected {len(github_urls)} GitHub URL(s): {github_urls}")
+        logger.info(f">> Detected {len(github_urls)} GitHub URL(s): {github_urls}")
         for repo_url in github_urls:
-            print(f">> Processing GitHub repository: {repo_url}")
-            markdown_text = convert_github_repo_to_markdown(repo_url)
-            if markdown_text:
-                repo_name = repo_url.split('/')[-1]
-                github_markdown_content.append({
-                    'repo_name': repo_name,
-                    'repo_url': repo_url,
-                    'content': markdown_text
-                })
-                print(f">> GitHub repository converted to markdown: {repo_name}")
-                
-                # Upload markdown to S3 and sync knowledge base if save keywords are present
-                message_lower = message_content_text.lower()
-                if "save" in message_lower or "save file" in message_lower or "save repo" in message_lower or "save the repo" in message_lower:
-                    knowledge_base_id = 'KALBYLJM4N'
-                    data_source_id = 'XCXWMKTBNA'
-                    # Use different S3 bucket for GitHub repositories
-                    github_bucket = 'ai-agent-knowlege-code-repository'
-                    print(f">> 'Save' keyword detected - uploading to S3 bucket: {github_bucket}")
-                    
+            tasks.append(('github', repo_url))
+    return tasks
+
+# Convert one attachment or repository to markdown; a failure only affects this item
+def _run_conversion_task(task):
+    kind, item = task
+    try:
+        if kind == 'pdf':
+            return convert_pdf_to_markdown(item['path'])
+        logger.info(f">> Processing GitHub repository: {item}")
+        return convert_github_repo_to_markdown(item)
+    except Exception as e:
+        logger.warning(f">> Warning: Conversion failed for {item}: {e}")
+        return None
+
+# Convert every task on conversion_executor with at most PREPROCESS_FANOUT of this turn
+# running at once; results keep task order
+def _run_conversion_tasks(tasks):
+    if len(tasks) < 2:
+        return [_run_conversion_task(task) for task in tasks]
+    # Submit a task only when one of this turn's slots is free, so waiting tasks do not
+    # hold executor threads
+    fanout = threading.BoundedSemaphore(PREPROCESS_FANOUT)
+    futures = []
+    for task in tasks:
+        fanout.acquire()
+        # Each task gets its own copy of the context so stage logs keep the thread id
+        future = conversion_executor.submit(contextvars.copy_context().run, _run_conversion_task, task)
+        future.add_done_callback(lambda _: fanout.release())
+        futures.append(future)
+    return [future.result() for future in futures]
+
+async def _arun_conversion_tasks(tasks):
+    fanout = asyncio.Semaphore(PREPROCESS_FANOUT)
+    loop = asyncio.get_running_loop()
+    
+    async def run(task):
+        async with fanout:
+            return await loop.run_in_executor(
+                conversion_executor, contextvars.copy_context().run, _run_conversion_task, task
+            )
+    
+    return await asyncio.gather(*(run(task) for task in tasks))
+
+# Blocking post-processing of converted documents: save requests and retrieval.
+# Returns (update, None, False) when the turn is answered without the agent, otherwise
+# (None, message_content, cacheable) with the text to send to Bedrock; cacheable is
+# True when the text is the bare prompt (no attachments or excerpts).
+def _prepare_agent_input(state, thread_id, tasks, results):
+    user_messages = state["messages"]
+    last_message = user_messages[-1]
+    message_content_text = last_message.content if last_message.content else ""
+    message_lower = message_content_text.lower()
+    
+    # Converted PDF and GitHub markdown, in message order
+    pdf_markdown_content = []
+    github_markdown_content = []
     
-                    result = upload_markdown_and_sync_kb(
-                        markdown_text, 
-                        f"{repo_name}.md", 
-                        knowledge_base_id, 
-                        data_source_id,
-                        bucket_name=github_bucket
-                    )
-                    if result:
-                        print(f">> Successfully uploaded and synced: {result['s3_uri']}")
-                        return {"messages": [ f"Successfully uploaded and synced: {result['s3_uri']}"]}
-                    else:
-                        print(f">> Warning: Upload/sync failed for {repo_name}")
-                        return {"messages": [ f"Failed to upload and sync: {repo_name}"]}
-                else:
-                    print(f">> GitHub repo converted but not saved (no 'save' keyword in message)")
+    for (kind, item), markdown_text in zip(tasks, results):
+        if kind == 'pdf':
+            if not markdown_text:
+                continue
+            file_name = item.get('name', 'Unknown PDF')
+            pdf_markdown_content.append({
+                'file_name': file_name,
+                'content': markdown_text
+            })
+            logger.info(f">> PDF converted to markdown: {file_name}")
+            
+            # Upload markdown to S3 and sync knowledge base only if message contains save keywords
+            if "save" in message_lower or "save file" in message_lower:
+                knowledge_base_id = 'KALBYLJM4N'
+                data_source_id = 'DFG01BWHSR'
+                s3_uri = find_unchanged_document(markdown_text, file_name, knowledge_base_id=knowledge_base_id,
+                                                 data_source_id=data_source_id)
+                if s3_uri:
+                    return _already_saved_update(file_name, s3_uri), None, False
+                logger.info(f">> 'Save file' detected - queueing S3 upload and knowledge base sync")
+                job_id = save_queue.enqueue(
+                    thread_id,
+                    file_name, 
+                    markdown_text, 
+                    knowledge_base_id, 
+                    data_source_id
+                )
+                return _save_queued_update(file_name, job_id), None, False
+            else:
+                logger.info(f">> PDF converted but not saved (no 'save file' keyword in message)")
+        else:
+            repo_url = item
+            if not markdown_text:
+                logger.warning(f">> Warning: Failed to convert GitHub repository: {repo_url}")
+                continue
+            repo_name = repo_url.split('/')[-1]
+            github_markdown_content.append({
+                'repo_name': repo_name,
+                'repo_url': repo_url,
+                'content': markdown_text
+            })
+            logger.info(f">> GitHub repository converted to markdown: {repo_name}")
+            
+            # Upload markdown to S3 and sync knowledge base if save keywords are present
+            if "save" in message_lower or "save file" in message_lower or "save repo" in message_lower or "save the repo" in message_lower:
+                knowledge_base_id = 'KALBYLJM4N'
+                data_source_id = 'XCXWMKTBNA'
+                # Use different S3 bucket for GitHub repositories
+                github_bucket = 'ai-agent-knowlege-code-repository'
+                s3_uri = find_unchanged_document(markdown_text, f"{repo_name}.md", github_bucket,
+                                                 knowledge_base_id=knowledge_base_id, data_source_id=data_source_id)
+                if s3_uri:
+                    return _already_saved_update(repo_name, s3_uri), None, False
+                logger.info(f">> 'Save' keyword detected - queueing upload to S3 bucket: {github_bucket}")
+                job_id = save_queue.enqueue(
+                    thread_id,
+                    f"{repo_name}.md", 
+                    markdown_text, 
+                    knowledge_base_id, 
+                    data_source_id,
+                    bucket_name=github_bucket
+                )
+                return _save_queued_update(repo_name, job_id), None, False
             else:
-                print(f">> Warning: Failed to convert GitHub repository: {repo_url}")
+                logger.info(f">> GitHub repo converted but not saved (no 'save' keyword in message)")
 
     # invoke agent with conversation history
-    print(">> Sending to Bedrock:", repr(user_messages))
-    print(">> Sending to Bedrock:", repr(last_message.content))
-    print(">> Sending to Bedrock:", repr(last_message.id))
+    logger.debug(">> Sending to Bedrock: %r", user_messages)
+    logger.info(">> Sending to Bedrock: %r", last_message.content)
+    logger.info(">> Sending to Bedrock: %r", last_message.id)
     
-    # Add PDF markdown content to the message if PDFs were converted
+    # Index converted documents for this thread; documents seen on earlier turns are skipped
     message_content = last_message.content
-    if pdf_markdown_content:
-        pdf_sections = []
-        for pdf_data in pdf_markdown_content:
-            pdf_section = f"\n\n--- Content from PDF: {pdf_data['file_name']} ---\n{pdf_data['content']}\n--- End of PDF content ---"
-            pdf_sections.append(pdf_section)
-        message_content = message_content + "".join(pdf_sections)
-        print(f">> Added {len(pdf_markdown_content)} PDF(s) as markdown to the message")
+    document_index = thread_indexes.get(thread_id, create=bool(pdf_markdown_content or github_markdown_content))
+    for pdf_data in pdf_markdown_content:
+        source_id = hashlib.sha256(pdf_data['content'].encode('utf-8')).hexdigest()
+        if document_index.add_document(source_id, f"PDF: {pdf_data['file_name']}", pdf_data['content']):
+            logger.info(f">> Indexed PDF for retrieval: {pdf_data['file_name']}")
+    for repo_data in github_markdown_content:
+        source_id = hashlib.sha256(repo_data['content'].encode('utf-8')).hexdigest()
+        if document_index.add_document(source_id, f"GitHub Repository: {repo_data['repo_name']} ({repo_data['repo_url']})", repo_data['content']):
+            logger.info(f">> Indexed GitHub repository for retrieval: {repo_data['repo_name']}")
+    
+    # Add the excerpts relevant to the question (also on follow-up turns without attachments)
+    if document_index is not None:
+        excerpts = document_index.select_context(message_content, RETRIEVAL_TOP_K, RETRIEVAL_CHAR_BUDGET)
+        if excerpts:
+            sections = [f"\n\n[{chunk['title']}]\n{chunk['text']}" for chunk in excerpts]
+            message_content = (message_content + "\n\n--- Relevant excerpts from attached documents ---"
+                               + "".join(sections) + "\n--- End of excerpts ---")
+            logger.info(f">> Added {len(excerpts)} excerpt(s) ({sum(len(chunk['text']) for chunk in excerpts)} characters) to the message")
+
+    return None, message_content, message_content == last_message.content
+
+# Blocking Bedrock agent call that forwards each completion chunk to on_chunk
+def _invoke_agent_streaming(endpoint, message_content, on_chunk, session_id):
+    response = endpoint.get_client().invoke_agent(
+        agentId=endpoint.agent_id,
+        agentAliasId=endpoint.alias_id,
+        sessionId=session_id,
+        inputText=message_content,
+        streamingConfigurations={"streamFinalResponse": True}
+    )
+    chunks = []
+    for event in response["completion"]:
+        if "chunk" in event:
+            text = event["chunk"].get("bytes", b"").decode("utf-8")
+            if text:
+                chunks.append(text)
+                on_chunk(text)
+    output_text = "".join(chunks)
+    logger.info("<< Streamed from Bedrock: %d characters in %d chunk(s)", len(output_text), len(chunks))
+    return output_text
+
+# Blocking Bedrock agent call
+def _invoke_agent(endpoint, message_content, on_chunk=None, session_id=None):
+    session_id = session_id or str(uuid.uuid4())
+    streamed = STREAM_AGENT_RESPONSES and on_chunk is not None
+    with stage_span("agent_invoke", endpoint=endpoint.name, session_id=session_id, streamed=streamed,
+                    input_bytes=len(message_content.encode("utf-8"))) as span:
+        if streamed:
+            output_text = _invoke_agent_streaming(endpoint, message_content, on_chunk, session_id)
+        else:
+            response = endpoint.get_model().invoke({"input": message_content, "session_id": session_id})
+            #response2 = model.invoke(state["messages"])
+            logger.info("<< Received from Bedrock: %r", response)
+            #logger.info("<< Received from Bedrock: %r", response2)
+            if hasattr(response, "return_values") and "output" in response.return_values:
+                output_text = response.return_values["output"]
+            else:
+                output_text = str(response)
+        span["output_bytes"] = len(output_text.encode("utf-8"))
+    return output_text
+
+# Pick the Bedrock session for this turn on endpoint: reuse the thread's session unless
+# it has been idle past the agent's session TTL, reached its maximum age or belongs to
+# another endpoint (sessions do not carry over between aliases or regions)
+def _resolve_agent_session(state, endpoint):
+    now = time.time()
+    session_id = state.get("agent_session_id")
+    started = state.get("agent_session_started") or 0
+    last_used = state.get("agent_session_last_used") or 0
+    bound_to = state.get("agent_endpoint")
+    if bound_to is not None and bound_to != endpoint.name:
+        if session_id:
+            logger.info(f">> Thread moved from {bound_to} to {endpoint.name}, starting a new Bedrock session")
+        return {"agent_session_id": str(uuid.uuid4()), "agent_session_started": now}
+    if session_id and now - last_used < AGENT_SESSION_IDLE_TTL_SECONDS and now - started < AGENT_SESSION_MAX_AGE_SECONDS:
+        return {"agent_session_id": session_id, "agent_session_started": started}
+    if session_id:
+        logger.info(f">> Rotating Bedrock session {session_id} (expired)")
+    return {"agent_session_id": str(uuid.uuid4()), "agent_session_started": now}
+
+# Forwards streamed chunks and records whether any reached the user: a failed call is
+# only retried while nothing has been streamed, so replies are never duplicated
+class _ChunkTracker:
+    def __init__(self, on_chunk):
+        self.on_chunk = on_chunk
+        self.sent = False
     
-    # Add GitHub repository markdown content to the message if repos were converted
-    if github_markdown_content:
-        github_sections = []
-        for repo_data in github_markdown_content:
-            github_section = f"\n\n--- Content from GitHub Repository: {repo_data['repo_name']} ({repo_data['repo_url']}) ---\n{repo_data['content']}\n--- End of GitHub repository content ---"
-            github_sections.append(github_section)
-        message_content = message_content + "".join(github_sections)
-        print(f">> Added {len(github_markdown_content)} GitHub repo(s) as markdown to the message")
+    def __call__(self, text):
+        self.sent = True
+        self.on_chunk(text)
     
-    response = model.invoke({"input": message_content})
-    #response2 = model.invoke(state["messages"])
-    print("<< Received from Bedrock:", repr(response))
-    #print("<< Received from Bedrock:", repr(response2))
-    if hasattr(response, "return_values") and "output" in response.return_values:
-        output_text = response.return_values["output"]
-    else:
-        output_text = str(response)
-    return {"messages": [output_text]}
+    def nothing_sent(self):
+        return not self.sent
+
+def _agent_call_args(endpoint, message_content, tracker, session):
+    retry_if = tracker.nothing_sent if tracker is not None else None
+    return (endpoint, message_content, tracker, session["agent_session_id"]), retry_if
+
+def _replace_rejected_session(session, error):
+    from botocore.exceptions import ClientError
+    
+    if not isinstance(error, ClientError) or "session" not in str(error).lower():
+        return None
+    logger.info(f">> Bedrock rejected session {session['agent_session_id']}, starting a new one: {error}")
+    return {"agent_session_id": str(uuid.uuid4()), "agent_session_started": time.time()}
+
+# One agent call on endpoint through its limiter; a session the service no longer
+# accepts is replaced once. Returns the output text and the session used.
+def _call_endpoint(endpoint, message_content, tracker, session):
+    limiter = agent_limiters.get(endpoint.name)
+    args, retry_if = _agent_call_args(endpoint, message_content, tracker, session)
+    try:
+        return limiter.call(_invoke_agent, *args, retry_if=retry_if), session
+    except Exception as e:
+        new_session = _replace_rejected_session(session, e)
+        if new_session is None:
+            raise
+        args, retry_if = _agent_call_args(endpoint, message_content, tracker, new_session)
+        return limiter.call(_invoke_agent, *args, retry_if=retry_if), new_session
+
+async def _acall_endpoint(endpoint, message_content, tracker, session):
+    limiter = agent_limiters.get(endpoint.name)
+    args, retry_if = _agent_call_args(endpoint, message_content, tracker, session)
+    try:
+        return await limiter.acall(_invoke_agent, *args, retry_if=retry_if), session
+    except Exception as e:
+        new_session = _replace_rejected_session(session, e)
+        if new_session is None:
+            raise
+        args, retry_if = _agent_call_args(endpoint, message_content, tracker, new_session)
+        return await limiter.acall(_invoke_agent, *args, retry_if=retry_if), new_session
+
+# Endpoint health verdict for a failed call: overload, outage and connection errors
+# count against the endpoint, anything else is the request's fault
+def _endpoint_at_fault(error):
+    from botocore.exceptions import BotoCoreError
+
+    return is_capacity_error(error) or isinstance(error, BotoCoreError)
+
+# Try the next endpoint only while nothing has reached the user and one is left to try
+def _can_fail_over(error, tracker, tried):
+    if not _endpoint_at_fault(error) or (tracker is not None and tracker.sent):
+        return False
+    return len(tried) < len(agent_pool.endpoints)
+
+def _session_update(session, endpoint):
+    return {**session, "agent_session_last_used": time.time(), "agent_endpoint": endpoint.name}
+
+# Invoke the agent for the thread on its pool endpoint, failing over to the other
+# endpoints when it is overloaded or down. Returns the output text and the session
+# state to store.
+def _invoke_agent_in_session(message_content, on_chunk, state):
+    tracker = _ChunkTracker(on_chunk) if on_chunk is not None else None
+    tried = []
+    while True:
+        endpoint = agent_pool.acquire(state.get("agent_endpoint"), exclude=tried)
+        healthy = None
+        try:
+            output_text, session = _call_endpoint(endpoint, message_content, tracker, _resolve_agent_session(state, endpoint))
+            healthy = True
+        except Exception as e:
+            healthy = not _endpoint_at_fault(e)
+            tried.append(endpoint.name)
+            if not _can_fail_over(e, tracker, tried):
+                raise
+            logger.warning(f">> Agent endpoint {endpoint.name} failed ({e}), failing over")
+            continue
+        finally:
+            endpoint.finish(healthy)
+        return output_text, _session_update(session, endpoint)
+
+async def _ainvoke_agent_in_session(message_content, on_chunk, state):
+    tracker = _ChunkTracker(on_chunk) if on_chunk is not None else None
+    tried = []
+    while True:
+        endpoint = agent_pool.acquire(state.get("agent_endpoint"), exclude=tried)
+        healthy = None
+        try:
+            output_text, session = await _acall_endpoint(endpoint, message_content, tracker, _resolve_agent_session(state, endpoint))
+            healthy = True
+        except Exception as e:
+            healthy = not _endpoint_at_fault(e)
+            tried.append(endpoint.name)
+            if not _can_fail_over(e, tracker, tried):
+                raise
+            logger.warning(f">> Agent endpoint {endpoint.name} failed ({e}), failing over")
+            continue
+        finally:
+            endpoint.finish(healthy)
+        return output_text, _session_update(session, endpoint)
+
+# True if this turn's agent call opens a new Bedrock session: only those answers depend
+# on the prompt alone, follow-ups inside a session depend on the earlier turns
+def _starts_new_session(state):
+    now = time.time()
+    return (not state.get("agent_session_id")
+            or now - (state.get("agent_session_last_used") or 0) >= AGENT_SESSION_IDLE_TTL_SECONDS
+            or now - (state.get("agent_session_started") or 0) >= AGENT_SESSION_MAX_AGE_SECONDS)
+
+# Only a turn that opens a new session and carries no earlier cached exchange depends
+# on the prompt alone
+def _cache_eligible(state, cacheable):
+    return cacheable and _starts_new_session(state) and not state.get("agent_pending_context")
+
+# Response cache lookups for attachment-free prompts that start a new session
+def _get_cached_response(state, message_content, cacheable):
+    if response_cache is None or not _cache_eligible(state, cacheable):
+        return None
+    output_text = response_cache.get(message_content, *agent_pool.cache_identity())
+    if output_text is not None:
+        logger.info(">> Response cache hit: %s", response_cache.stats())
+    return output_text
+
+def _cache_response(state, message_content, cacheable, output_text):
+    if response_cache is not None and output_text and _cache_eligible(state, cacheable):
+        response_cache.put(message_content, *agent_pool.cache_identity(), output_text)
+
+# A cached answer never reaches Bedrock: keep the exchange so the call that opens the
+# thread's session can replay it and follow-ups keep their context
+def _cache_hit_update(message_content, output_text):
+    return {
+        "messages": [output_text],
+        "save_job_ids": [],
+        "agent_pending_context": [{"prompt": message_content, "answer": output_text}]
+    }
+
+# Prepend the exchanges answered from the cache to the first message of a new session
+def _with_pending_context(state, message_content):
+    pending = state.get("agent_pending_context")
+    if not pending or not _starts_new_session(state):
+        return message_content
+    exchanges = "".join(f"\n\nUser: {item['prompt']}\n\nAssistant: {item['answer']}" for item in pending)
+    return ("--- Earlier in this conversation ---" + exchanges + "\n--- End of earlier conversation ---\n\n"
+            + message_content)
+
+# Graph state: the conversation, the Bedrock agent session (and pool endpoint) bound to the
+# thread and the cached exchanges that session has not seen yet
+class ChatState(MessagesState):
+    agent_endpoint: str
+    agent_session_id: str
+    agent_session_started: float
+    agent_session_last_used: float
+    agent_pending_context: list
+    save_job_ids: list
+
+# Time a whole turn and tag every stage logged inside it with the Chainlit thread id
+@contextmanager
+def _turn_span(config):
+    token = current_thread_id.set(config["configurable"].get("thread_id"))
+    try:
+        with stage_span("turn") as span:
+            yield span
+    finally:
+        current_thread_id.reset(token)
+
+# --- Node function ---
+def generate_answer(state: ChatState, config):
+    with _turn_span(config) as span:
+        tasks = _collect_conversion_tasks(state["messages"][-1])
+        span["conversions"] = len(tasks)
+        results = _run_conversion_tasks(tasks)
+        update, message_content, cacheable = _prepare_agent_input(state, config["configurable"].get("thread_id"), tasks, results)
+        if update is not None:
+            span["answered_by"] = "save"
+            return update
+        output_text = _get_cached_response(state, message_content, cacheable)
+        if output_text is not None:
+            span["answered_by"] = "cache"
+            return _cache_hit_update(message_content, output_text)
+        span["answered_by"] = "agent"
+        try:
+            output_text, session = _invoke_agent_in_session(_with_pending_context(state, message_content), get_stream_writer(), state)
+        except AgentThrottledError as e:
+            logger.warning(f">> Agent unavailable: {e}")
+            span["answered_by"] = "busy"
+            return {"messages": [AGENT_BUSY_MESSAGE], "save_job_ids": []}
+        _cache_response(state, message_content, cacheable, output_text)
+        return {"messages": [output_text], "save_job_ids": [], "agent_pending_context": [], **session}
+
+# Async variant used by flow.ainvoke: blocking work runs in worker threads so the
+# Chainlit event loop keeps serving other users, conversions fan out concurrently,
+# and in-flight agent calls are capped.
+async def agenerate_answer(state: ChatState, config):
+    with _turn_span(config) as span:
+        tasks = _collect_conversion_tasks(state["messages"][-1])
+        span["conversions"] = len(tasks)
+        results = await _arun_conversion_tasks(tasks)
+        update, message_content, cacheable = await asyncio.to_thread(_prepare_agent_input, state, config["configurable"].get("thread_id"), tasks, results)
+        if update is not None:
+            span["answered_by"] = "save"
+            return update
+        output_text = _get_cached_response(state, message_content, cacheable)
+        if output_text is not None:
+            span["answered_by"] = "cache"
+            return _cache_hit_update(message_content, output_text)
+        span["answered_by"] = "agent"
+        try:
+            output_text, session = await _ainvoke_agent_in_session(_with_pending_context(state, message_content), get_stream_writer(), state)
+        except AgentThrottledError as e:
+            logger.warning(f">> Agent unavailable: {e}")
+            span["answered_by"] = "busy"
+            return {"messages": [AGENT_BUSY_MESSAGE], "save_job_ids": []}
+        _cache_response(state, message_content, cacheable, output_text)
+        return {"messages": [output_text], "save_job_ids": [], "agent_pending_context": [], **session}
 
 # Initialize the LangGraph workflow
-chatbot_graph = StateGraph(MessagesState)
+chatbot_graph = StateGraph(ChatState)
 
-# Add a node that generates an answer
-chatbot_graph.add_node("response", generate_answer)
+# Add a node that generates an answer (sync for flow.invoke, async for flow.ainvoke)
+chatbot_graph.add_node("response", RunnableLambda(generate_answer, afunc=agenerate_answer, name="response"))
 
 # Define the flow: Start at "response" and then end
 chatbot_graph.set_entry_point("response")
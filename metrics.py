@@ -0,0 +1,227 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+# Chainlit thread the current turn belongs to; set by the graph node and read by spans
+current_thread_id = contextvars.ContextVar("current_thread_id", default=None)
+
+# Latency buckets in seconds, from fast cache hits to multi-minute repository clones
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Payload size buckets in bytes, 1 KiB to 256 MiB
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(10))
+
+
+# Cumulative histogram in the Prometheus exposition format
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+
+# Process-wide store of counters and histograms keyed by metric name and labels
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store rendered as Prometheus text
+
+    Labels are kept low-cardinality (stage, outcome); per-thread detail goes to the
+    structured logs instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    def inc(self, name, labels, value=1, help_text=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help_text))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, labels, value, help_text=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("gauge", help_text))
+            self._gauges[key] = value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS, help_text=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help_text))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+            return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            for name, (metric_type, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                if metric_type in ("counter", "gauge"):
+                    values = self._counters if metric_type == "counter" else self._gauges
+                    for (metric_name, labels), value in sorted(values.items()):
+                        if metric_name == name:
+                            lines.append(f"{name}{label_text(labels)} {value}")
+                    continue
+                for (metric_name, labels), histogram in sorted(self._histograms.items()):
+                    if metric_name != name:
+                        continue
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{label_text(labels, (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{label_text(labels, (('le', '+Inf'),))} {histogram.total}")
+                    lines.append(f"{name}_sum{label_text(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{label_text(labels)} {histogram.total}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Timing span around one pipeline stage
+@contextmanager
+def stage_span(stage, **fields):
+    """
+    Time a stage, record it in the registry and write a structured log line
+
+    The yielded dict can be updated inside the block with payload sizes; keys ending
+    in "_bytes" are also recorded in the chatbot_stage_payload_bytes histogram. Setting
+    span["outcome"] marks a stage that failed without raising (e.g. a git exit code).
+
+    Args:
+        stage: Stage name (pdf_conversion, repo_clone, ast_parse, markdown_generation,
+            s3_upload, ingestion_start, agent_invoke, turn)
+        **fields: Extra fields for the log line (sizes, counts, identifiers)
+    """
+    span = dict(fields)
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        if outcome == "ok":
+            outcome = span.pop("outcome", outcome)
+        registry.observe("chatbot_stage_duration_seconds", {"stage": stage}, duration,
+                         help_text="Duration of pipeline stages in seconds")
+        registry.inc("chatbot_stage_total", {"stage": stage, "outcome": outcome},
+                     help_text="Completed pipeline stages by outcome")
+        for name, value in span.items():
+            if name.endswith("_bytes") and isinstance(value, (int, float)):
+                registry.observe("chatbot_stage_payload_bytes", {"stage": stage, "payload": name[:-len("_bytes")]},
+                                 value, buckets=SIZE_BUCKETS, help_text="Payload sizes handled by pipeline stages")
+        logger.info("stage %s %s in %.3fs", stage, outcome, duration, extra={"fields": {
+            "event": "stage",
+            "stage": stage,
+            "outcome": outcome,
+            "duration_seconds": round(duration, 6),
+            "thread_id": current_thread_id.get(),
+            **span
+        }})
+
+
+# One JSON object per log line, with span fields merged in
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level=None):
+    """Send application logs to stderr as JSON lines (LOG_LEVEL, default INFO)"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level or os.environ.get("LOG_LEVEL", "INFO"))
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port, host="0.0.0.0", port_span=1):
+    """
+    Serve /metrics in the Prometheus text format from a background thread
+
+    Each worker process has its own registry, so with several workers on a node every
+    process binds the first free port of port..port+port_span-1 and is scraped separately.
+
+    Args:
+        port: First port to try
+        host: Interface to bind
+        port_span: Number of consecutive ports to try
+
+    Returns:
+        ThreadingHTTPServer or None if no port could be bound
+    """
+    global _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    if _metrics_server is not None:
+        return _metrics_server
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    for candidate in range(port, port + max(port_span, 1)):
+        try:
+            _metrics_server = ThreadingHTTPServer((host, candidate), MetricsHandler)
+            break
+        except OSError as e:
+            error = e
+    else:
+        logger.warning("Metrics endpoint not started on ports %s-%s: %s", port, port + max(port_span, 1) - 1, error)
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics (pid %s)", host, _metrics_server.server_address[1], os.getpid())
+    return _metrics_server
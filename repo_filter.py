@@ -0,0 +1,237 @@
+import fnmatch
+import logging
+import os
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# Directories and files never worth parsing: environments, dependencies, build output,
+# caches, generated protobuf stubs and test fixtures (gitignore syntax)
+DEFAULT_EXCLUDE_PATTERNS = (
+    '.hg/', '.svn/',
+    '.venv/', 'venv/', '.env/', 'env/', '.tox/', '.nox/', 'site-packages/', 'node_modules/',
+    'build/', 'dist/', '*.egg-info/', '.eggs/',
+    '__pycache__/', '.mypy_cache/', '.pytest_cache/', '.ruff_cache/', '.ipynb_checkpoints/',
+    '*_pb2.py', '*_pb2_grpc.py', '*_pb2.pyi',
+    'fixtures/', 'testdata/', 'test_data/'
+)
+
+
+# Translate a gitignore glob into a regular expression over '/'-separated paths
+def _glob_to_regex(pattern):
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+            continue
+        if pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+            continue
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', index + 2)
+            if end == -1:
+                parts.append(re.escape(char))
+            else:
+                body = pattern[index + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append(f"[{body.replace(chr(92), chr(92) * 2)}]")
+                index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            parts.append(re.escape(pattern[index]))
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return re.compile(''.join(parts) + r'\Z')
+
+
+# One line of a .gitignore file (or of the exclude list)
+class IgnoreRule:
+    """
+    Args:
+        pattern: gitignore pattern ('!' negates, a trailing '/' matches directories only,
+            a '/' elsewhere anchors the pattern to base)
+        base: Directory (relative, '/'-separated, '' for the root) the pattern applies to
+    """
+
+    def __init__(self, pattern, base=''):
+        self.pattern = pattern
+        self.base = base
+        self.negated = pattern.startswith('!')
+        if self.negated:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        self.anchored = '/' in pattern
+        self.regex = _glob_to_regex(pattern.lstrip('/'))
+
+    def matches(self, relative_path, is_dir):
+        """True if the rule matches relative_path (relative to the repository root)"""
+        if self.dir_only and not is_dir:
+            return False
+        if self.base:
+            if not relative_path.startswith(self.base + '/'):
+                return False
+            relative_path = relative_path[len(self.base) + 1:]
+        if self.anchored:
+            return self.regex.match(relative_path) is not None
+        return self.regex.match(relative_path.rsplit('/', 1)[-1]) is not None
+
+
+# Parse the rules of one .gitignore file
+def read_gitignore(path, base=''):
+    rules = []
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError as e:
+        logger.warning(f"Could not read {path}: {e}")
+        return rules
+    for line in lines:
+        # Trailing spaces are ignored unless escaped
+        stripped = line.rstrip(' ') if not line.endswith('\\ ') else line
+        if not stripped or stripped.startswith('#'):
+            continue
+        rules.append(IgnoreRule(stripped, base))
+    return rules
+
+
+# Last matching rule decides, as in git; None when no rule matches
+def _match_rules(rules, relative_path, is_dir):
+    verdict = None
+    for rule in rules:
+        if rule.matches(relative_path, is_dir):
+            verdict = not rule.negated
+    return verdict
+
+
+# Selects the files of a checked-out repository worth parsing
+class RepoFileFilter:
+    """
+    Walk a repository and select the files to parse, within size and count budgets
+
+    Directories are pruned during the walk, so an excluded tree such as node_modules is
+    never listed (.git is always pruned). A path is skipped when it matches the exclude
+    list ('excluded') or the repository's .gitignore files ('gitignore', nested files
+    apply below their directory); files larger than max_file_bytes are skipped as
+    'too_large'. The walk is sorted, and stops at the first file that would exceed
+    max_files or max_total_bytes ('file_budget' / 'byte_budget'), so the same tree
+    always yields the same selection.
+
+    Args:
+        include_patterns: Filename globs of the files to select (e.g. '*.py')
+        exclude_patterns: gitignore-style patterns applied from the repository root
+        use_gitignore: Honor the repository's .gitignore files
+        max_file_bytes: Largest file selected (0 for no limit)
+        max_files: Most files selected (0 for no limit)
+        max_total_bytes: Most bytes selected in total (0 for no limit)
+    """
+
+    def __init__(self, include_patterns=('*.py',), exclude_patterns=DEFAULT_EXCLUDE_PATTERNS, use_gitignore=True,
+                 max_file_bytes=0, max_files=0, max_total_bytes=0):
+        self.include_patterns = tuple(include_patterns)
+        self.exclude_rules = [IgnoreRule(pattern) for pattern in exclude_patterns if pattern]
+        self.use_gitignore = use_gitignore
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.max_total_bytes = max_total_bytes
+
+    def _skip_reason(self, relative_path, is_dir, gitignore_rules):
+        if _match_rules(self.exclude_rules, relative_path, is_dir):
+            return 'excluded'
+        if gitignore_rules and _match_rules(gitignore_rules, relative_path, is_dir):
+            return 'gitignore'
+        return None
+
+    def select(self, root):
+        """
+        Select the files under root
+
+        Args:
+            root: Repository working tree
+
+        Returns:
+            dict: 'files' (absolute paths in walk order), 'total_bytes', 'skipped'
+                (reason -> relative paths, directories with a trailing '/') and 'truncated'
+                (True if a budget stopped the walk early)
+        """
+        files = []
+        skipped = {}
+        total_bytes = 0
+        truncated = False
+        gitignore_rules = []
+
+        def skip(reason, relative_path):
+            skipped.setdefault(reason, []).append(relative_path)
+
+        for dir_path, dir_names, file_names in os.walk(root):
+            relative_dir = os.path.relpath(dir_path, root).replace(os.sep, '/')
+            relative_dir = '' if relative_dir == '.' else relative_dir
+            if self.use_gitignore and '.gitignore' in file_names:
+                gitignore_rules.extend(read_gitignore(os.path.join(dir_path, '.gitignore'), relative_dir))
+
+            # Prune in place so os.walk does not descend into skipped directories
+            kept = []
+            for name in sorted(dir_names):
+                if name == '.git':
+                    continue
+                relative_path = f"{relative_dir}/{name}" if relative_dir else name
+                reason = self._skip_reason(relative_path, True, gitignore_rules)
+                if reason:
+                    skip(reason, relative_path + '/')
+                else:
+                    kept.append(name)
+            dir_names[:] = kept
+
+            for name in sorted(file_names):
+                if not any(fnmatch.fnmatchcase(name, pattern) for pattern in self.include_patterns):
+                    continue
+                relative_path = f"{relative_dir}/{name}" if relative_dir else name
+                reason = self._skip_reason(relative_path, False, gitignore_rules)
+                if reason:
+                    skip(reason, relative_path)
+                    continue
+                file_path = os.path.join(dir_path, name)
+                try:
+                    size = os.path.getsize(file_path)
+                except OSError:
+                    skip('unreadable', relative_path)
+                    continue
+                if self.max_file_bytes and size > self.max_file_bytes:
+                    skip('too_large', relative_path)
+                    continue
+                if self.max_files and len(files) >= self.max_files:
+                    skip('file_budget', relative_path)
+                    truncated = True
+                    break
+                if self.max_total_bytes and total_bytes + size > self.max_total_bytes:
+                    skip('byte_budget', relative_path)
+                    truncated = True
+                    break
+                files.append(file_path)
+                total_bytes += size
+            if truncated:
+                break
+
+        return {'files': files, 'total_bytes': total_bytes, 'skipped': skipped, 'truncated': truncated}
+
+
+# One-line summary of a selection's skipped paths for logs
+def describe_skipped(selection, examples=3):
+    parts = []
+    for reason, paths in sorted(selection['skipped'].items()):
+        sample = ', '.join(paths[:examples]) + (', ...' if len(paths) > examples else '')
+        parts.append(f"{reason}: {len(paths)} ({sample})")
+    if selection['truncated']:
+        parts.append("budget reached, walk stopped early")
+    return '; '.join(parts) or 'nothing skipped'
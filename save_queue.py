@@ -0,0 +1,261 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from utils import get_boto3_client, kb_manifest, markdown_content_hash, upload_markdown_and_sync_kb
+
+
+logger = logging.getLogger(__name__)
+
+
+# Durable background queue for "save" requests (S3 upload + knowledge base ingestion)
+class SaveJobQueue:
+    """
+    SQLite-backed queue of knowledge base save jobs processed by background workers
+
+    A job moves through queued -> uploading -> ingesting -> complete | failed. Jobs and
+    their markdown are stored in the database before the chat reply is sent, so a crash
+    of the web process does not lose them. Workers refresh updated_at while they own a
+    job; jobs not refreshed for lease_seconds are taken over by any worker (in this or
+    another process), which re-uploads or resumes polling the ingestion job. The markdown
+    of a job is cleared once it reaches a terminal status.
+
+    Args:
+        db_path: SQLite database file
+        workers: Number of worker threads (maximum concurrent save jobs)
+        poll_initial_seconds: First delay between get_ingestion_job polls
+        poll_max_seconds: Upper bound for the polling delay
+        lease_seconds: Time after which an unrefreshed job is considered abandoned
+    """
+
+    TERMINAL_STATUSES = ('complete', 'failed')
+    INGESTION_RUNNING_STATUSES = ('STARTING', 'IN_PROGRESS', 'STOPPING')
+
+    def __init__(self, db_path, workers=2, poll_initial_seconds=5, poll_max_seconds=60, lease_seconds=300):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_initial_seconds = poll_initial_seconds
+        self.poll_max_seconds = poll_max_seconds
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS save_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    name TEXT NOT NULL,
+                    markdown TEXT NOT NULL,
+                    knowledge_base_id TEXT NOT NULL,
+                    data_source_id TEXT NOT NULL,
+                    bucket_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    detail TEXT,
+                    s3_uri TEXT,
+                    ingestion_job_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS save_jobs_status ON save_jobs (status, updated_at);
+                """
+            )
+            # Finished jobs written before their markdown was cleared on completion
+            conn.execute(
+                "UPDATE save_jobs SET markdown = '' WHERE status IN (?, ?) AND markdown != ''",
+                self.TERMINAL_STATUSES
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, thread_id, name, markdown_content, knowledge_base_id, data_source_id,
+                bucket_name='ai-agent-knowledge-documents'):
+        """
+        Store a save job and wake a worker
+
+        Returns:
+            str: Job id
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO save_jobs (job_id, thread_id, name, markdown, knowledge_base_id, data_source_id, "
+                "bucket_name, status, detail, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, thread_id, name, markdown_content, knowledge_base_id, data_source_id, bucket_name,
+                 'Waiting for a worker', now, now)
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        logger.info(f"Save job queued: {job_id} ({name})")
+        return job_id
+
+    def get(self, job_id):
+        """Return the job's status fields as a dict, or None if unknown"""
+        row = self._connect().execute(
+            "SELECT job_id, thread_id, name, status, detail, s3_uri, ingestion_job_id, updated_at "
+            "FROM save_jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"save-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE save_jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+
+    def _finish(self, job_id, status, detail, **fields):
+        # The markdown is only needed to upload; the column is NOT NULL, so store ''
+        self._update(job_id, status=status, detail=detail, markdown='', **fields)
+
+    def _claim(self):
+        # BEGIN IMMEDIATE takes the write lock, so only one worker (in any process) claims a job.
+        # A queued job leaves the queued status in the same transaction; the returned row
+        # keeps the status it was claimed in, so a stale 'uploading' job reads as a retry.
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM save_jobs WHERE status = 'queued' "
+                "OR (status IN ('uploading', 'ingesting') AND updated_at < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now - self.lease_seconds,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE save_jobs SET status = CASE WHEN status = 'queued' THEN 'uploading' ELSE status END, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (now, row['job_id'])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return dict(row) if row else None
+
+    def _worker_loop(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Save queue error: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=5)
+                continue
+            try:
+                self._process(job)
+            except Exception as e:
+                logger.error(f"Save job {job['job_id']} failed: {e}")
+                self._finish(job['job_id'], 'failed', f"Save failed: {e}")
+
+    def _process(self, job):
+        job_id = job['job_id']
+
+        # A job taken over after a crash resumes polling if its ingestion job already started
+        if job['status'] == 'ingesting' and job['ingestion_job_id']:
+            self._wait_for_ingestion(job, job['ingestion_job_id'])
+            return
+
+        self._update(job_id, status='uploading', detail=f"Uploading {job['name']} to S3")
+        # A job taken over from another worker is retried in full, even if its content
+        # looks up to date
+        result = upload_markdown_and_sync_kb(
+            job['markdown'],
+            job['name'],
+            job['knowledge_base_id'],
+            job['data_source_id'],
+            bucket_name=job['bucket_name'],
+            skip_unchanged=job['status'] == 'queued'
+        )
+        if not result:
+            self._finish(job_id, 'failed', f"Failed to upload and sync: {job['name']}")
+            return
+        if result['unchanged']:
+            self._finish(job_id, 'complete', f"{job['name']} is already up to date in the knowledge base",
+                         s3_uri=result['s3_uri'])
+            return
+
+        job['s3_uri'] = result['s3_uri']
+        self._update(job_id, s3_uri=result['s3_uri'], detail=f"Uploaded to {result['s3_uri']}, waiting for ingestion to start")
+        # Ingestion requests are coalesced and may wait for a running job; keep the lease fresh
+        while True:
+            try:
+                ingestion_job = result['sync_job'].result(timeout=30)
+                break
+            except FutureTimeoutError:
+                self._update(job_id)
+        ingestion_job_id = ingestion_job.get('ingestionJobId')
+        self._update(job_id, status='ingesting', ingestion_job_id=ingestion_job_id,
+                     detail=f"Knowledge base ingestion {ingestion_job.get('status', 'STARTING').lower()}")
+        self._wait_for_ingestion(job, ingestion_job_id)
+
+    def _wait_for_ingestion(self, job, ingestion_job_id):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        bedrock_agent_client = get_boto3_client('bedrock-agent')
+        delay = self.poll_initial_seconds
+        while True:
+            time.sleep(delay)
+            try:
+                response = bedrock_agent_client.get_ingestion_job(
+                    knowledgeBaseId=job['knowledge_base_id'],
+                    dataSourceId=job['data_source_id'],
+                    ingestionJobId=ingestion_job_id
+                )
+            except (BotoCoreError, ClientError) as e:
+                error_code = e.response.get('Error', {}).get('Code') if isinstance(e, ClientError) else None
+                if error_code == 'ResourceNotFoundException':
+                    self._finish(job['job_id'], 'failed', f"Ingestion job {ingestion_job_id} no longer exists")
+                    return
+                # Throttling and transient errors: the ingestion job keeps running, so keep
+                # the lease and poll again later
+                logger.warning(f"Save job {job['job_id']}: could not poll ingestion job {ingestion_job_id}: {e}")
+                self._update(job['job_id'])
+                delay = min(delay * 2, self.poll_max_seconds)
+                continue
+            ingestion_job = response.get('ingestionJob', {})
+            status = ingestion_job.get('status', 'UNKNOWN')
+            stats = ingestion_job.get('statistics', {})
+            progress = (f"{stats.get('numberOfDocumentsScanned', 0)} scanned, "
+                        f"{stats.get('numberOfNewDocumentsIndexed', 0) + stats.get('numberOfModifiedDocumentsIndexed', 0)} indexed, "
+                        f"{stats.get('numberOfDocumentsFailed', 0)} failed")
+            if status in self.INGESTION_RUNNING_STATUSES:
+                self._update(job['job_id'], detail=f"Knowledge base ingestion {status.lower().replace('_', ' ')} ({progress})")
+                delay = min(delay * 2, self.poll_max_seconds)
+                continue
+            if status == 'COMPLETE':
+                # Only now may later saves of the same content be skipped
+                if job['s3_uri'] and not stats.get('numberOfDocumentsFailed'):
+                    kb_manifest.mark_ingested(job['s3_uri'], markdown_content_hash(job['markdown']))
+                self._finish(job['job_id'], 'complete', f"{job['name']} is now in the knowledge base ({progress})")
+            else:
+                reasons = '; '.join(ingestion_job.get('failureReasons', []))
+                self._finish(job['job_id'], 'failed', f"Ingestion ended with status {status} {reasons}".strip())
+            return
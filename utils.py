@@ -1,5 +1,15 @@
-from IPython.display import Image, display
 import warnings
+import hashlib
+import os
+import tempfile
+import logging
+import threading
+from contextlib import contextmanager
+
+from metrics import registry, stage_span
+from repo_filter import DEFAULT_EXCLUDE_PATTERNS, RepoFileFilter, describe_skipped
+
+logger = logging.getLogger(__name__)
 
 # save a graph to a file
 def save_graph_to_file(graph, file_path, format='png'):
@@ -20,16 +30,66 @@ def save_graph_to_file(graph, file_path, format='png'):
             else:
                 raise ValueError(f"Unsupported format: {format}")
         
-        print(f"Graph saved successfully at {file_path}")
+        logger.info(f"Graph saved successfully at {file_path}")
     except Exception as e:
-        print(f"Error saving graph: {e}")
+        logger.error(f"Error saving graph: {e}")
 
 # display the image in a Jupyter Notebook
 def show_graph(graph):
     try:
+        from IPython.display import Image, display
+        
         display(Image(graph.get_graph().draw_mermaid_png()))
     except Exception as e:
-        print(f"Error displaying graph: {e}")
+        logger.error(f"Error displaying graph: {e}")
+
+# Shared boto3 clients, one per (profile, region, service), reused across calls and threads
+BOTO_MAX_POOL_CONNECTIONS = int(os.environ.get('BOTO_MAX_POOL_CONNECTIONS', '32'))
+BOTO_TCP_KEEPALIVE = os.environ.get('BOTO_TCP_KEEPALIVE', 'true').lower() in ('1', 'true', 'yes')
+# Agent calls are retried by graph's AdaptiveLimiter, which backs off on throttling; a
+# single botocore attempt keeps the two retry layers from multiplying
+_BOTO_SERVICE_RETRIES = {'bedrock-agent-runtime': {'total_max_attempts': 1}}
+_boto3_sessions = {}
+_boto3_clients = {}
+_boto3_lock = threading.Lock()
+
+def get_boto3_client(service_name, profile_name='chatbot', region_name='us-east-1'):
+    """
+    Return the process-wide boto3 client for a service, creating it on first use
+    
+    Args:
+        service_name: AWS service name (e.g. 's3', 'bedrock-agent')
+        profile_name: AWS profile name (default: 'chatbot')
+        region_name: AWS region (default: 'us-east-1')
+    
+    Returns:
+        botocore client shared by every caller with the same (profile, region, service)
+    """
+    key = (profile_name, region_name, service_name)
+    client = _boto3_clients.get(key)
+    if client is not None:
+        return client
+    
+    # boto3 sessions are not thread-safe, so build sessions and clients under the lock
+    with _boto3_lock:
+        client = _boto3_clients.get(key)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+            
+            session = _boto3_sessions.get((profile_name, region_name))
+            if session is None:
+                session = boto3.Session(profile_name=profile_name, region_name=region_name)
+                _boto3_sessions[(profile_name, region_name)] = session
+            config = Config(
+                max_pool_connections=BOTO_MAX_POOL_CONNECTIONS,
+                tcp_keepalive=BOTO_TCP_KEEPALIVE
+            )
+            if service_name in _BOTO_SERVICE_RETRIES:
+                config = config.merge(Config(retries=_BOTO_SERVICE_RETRIES[service_name]))
+            client = session.client(service_name, config=config)
+            _boto3_clients[key] = client
+    return client
 
 # Upload PDF file to S3
 def upload_pdf_to_s3(file_path, bucket_name='ai-agent-knowledge-documents', profile_name='chatbot', region_name='us-east-1'):
@@ -45,14 +105,12 @@ def upload_pdf_to_s3(file_path, bucket_name='ai-agent-knowledge-documents', prof
     Returns:
         str: S3 URI of the uploaded file or None if upload failed
     """
-    import boto3
     import os
     from botocore.exceptions import ClientError
     
     try:
-        # Create S3 client with profile
-        session = boto3.Session(profile_name=profile_name, region_name=region_name)
-        s3_client = session.client('s3')
+        # Get the shared S3 client for this profile
+        s3_client = get_boto3_client('s3', profile_name, region_name)
         
         # Get the file name from the path
         file_name = os.path.basename(file_path)
@@ -61,26 +119,215 @@ def upload_pdf_to_s3(file_path, bucket_name='ai-agent-knowledge-documents', prof
         s3_client.upload_file(file_path, bucket_name, file_name)
         
         s3_uri = f"s3://{bucket_name}/{file_name}"
-        print(f"PDF uploaded successfully to {s3_uri}")
+        logger.info(f"PDF uploaded successfully to {s3_uri}")
         return s3_uri
         
     except ClientError as e:
-        print(f"Error uploading PDF to S3: {e}")
+        logger.error(f"Error uploading PDF to S3: {e}")
         return None
     except FileNotFoundError:
-        print(f"File not found: {file_path}")
+        logger.error(f"File not found: {file_path}")
         return None
     except Exception as e:
-        print(f"Unexpected error uploading PDF: {e}")
+        logger.error(f"Unexpected error uploading PDF: {e}")
         return None
 
+# Content-addressed on-disk cache for PDF -> markdown conversions
+class PdfMarkdownCache:
+    """
+    Cache converted markdown keyed by the SHA-256 of the PDF bytes and the converter version
+    
+    Entries are stored as <key>.md files in cache_dir. Writes go through a temporary file
+    and os.replace, so several workers can safely share one directory. Reads refresh the
+    entry's mtime and the least recently used entries are evicted once the directory
+    grows past max_bytes.
+    
+    Args:
+        cache_dir: Directory holding the cached markdown files
+        max_bytes: Maximum total size of the cache directory in bytes
+    """
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+    
+    def key_for(self, file_path, converter_version):
+        """Return the cache key for a PDF file and converter version"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(f"|{converter_version}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.md")
+    
+    def get(self, key):
+        """Return cached markdown for key or None on a miss"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                markdown_text = f.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return markdown_text
+    
+    def put(self, key, markdown_text):
+        """Atomically store markdown for key and evict old entries if over budget"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(markdown_text)
+            os.replace(temp_path, self._entry_path(key))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self._evict()
+    
+    def _evict(self):
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.md'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+        
+        # Oldest mtime first; another worker may have removed the file already
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                with self._lock:
+                    self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+    
+    def stats(self):
+        """Return hit/miss/eviction counters"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'chatbot', 'pdf_markdown'))
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+pdf_markdown_cache = PdfMarkdownCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+# One process pool for CPU-bound work (PDF page ranges, AST parsing), shared by every
+# request so the number of worker processes stays at PROCESS_POOL_WORKERS however many
+# users convert documents at once. Workers are started with forkserver (spawn where it
+# is unavailable): forking the threaded web process can deadlock in the child.
+PROCESS_POOL_WORKERS = int(os.environ.get('PROCESS_POOL_WORKERS', str(os.cpu_count() or 1)))
+PROCESS_POOL_START_METHOD = os.environ.get('PROCESS_POOL_START_METHOD', '')
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Return the shared ProcessPoolExecutor, creating it on first use"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                
+                start_method = PROCESS_POOL_START_METHOD or (
+                    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                )
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=max(1, PROCESS_POOL_WORKERS),
+                    mp_context=multiprocessing.get_context(start_method)
+                )
+                logger.info(f"Started process pool: {PROCESS_POOL_WORKERS} worker(s), {start_method}")
+    return _process_pool
+
+# executor.map on the shared pool; a pool broken by a crashed worker is replaced for the next caller
+def map_in_process_pool(fn, *iterables):
+    from concurrent.futures.process import BrokenProcessPool
+    
+    global _process_pool
+    pool = get_process_pool()
+    try:
+        return list(pool.map(fn, *iterables))
+    except BrokenProcessPool:
+        with _process_pool_lock:
+            if _process_pool is pool:
+                _process_pool = None
+        pool.shutdown(wait=False)
+        raise
+
+# Parallel page-range conversion settings: documents with fewer than
+# PDF_PARALLEL_MIN_PAGES pages are converted serially
+PDF_PAGES_PER_CHUNK = int(os.environ.get('PDF_PAGES_PER_CHUNK', '25'))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '100'))
+
+# Convert one page range of a PDF (runs inside a worker process)
+def _convert_pdf_page_range(file_path, pages):
+    import pymupdf4llm
+    return pymupdf4llm.to_markdown(file_path, pages=pages)
+
+# Convert a PDF by splitting it into page ranges converted in a process pool
+def convert_pdf_to_markdown_parallel(file_path, max_workers=None, pages_per_chunk=None, min_pages=None):
+    """
+    Convert a PDF to markdown by converting page ranges in parallel and joining them in order
+    
+    Args:
+        file_path: Path to the PDF file
+        max_workers: Set to 1 to convert serially (default: PROCESS_POOL_WORKERS, the shared pool's size)
+        pages_per_chunk: Pages converted per task (default: PDF_PAGES_PER_CHUNK)
+        min_pages: Page count below which the document is converted serially (default: PDF_PARALLEL_MIN_PAGES)
+    
+    Returns:
+        str: Markdown content of the PDF
+    """
+    import pymupdf
+    import pymupdf4llm
+    
+    max_workers = max_workers or PROCESS_POOL_WORKERS
+    pages_per_chunk = pages_per_chunk or PDF_PAGES_PER_CHUNK
+    min_pages = PDF_PARALLEL_MIN_PAGES if min_pages is None else min_pages
+    
+    with pymupdf.open(file_path) as doc:
+        page_count = doc.page_count
+    
+    if page_count < min_pages or max_workers < 2:
+        return pymupdf4llm.to_markdown(file_path)
+    
+    page_ranges = [list(range(start, min(start + pages_per_chunk, page_count)))
+                   for start in range(0, page_count, pages_per_chunk)]
+    logger.info(f"Converting {page_count} pages in {len(page_ranges)} chunk(s) on the shared process pool")
+    
+    # map returns results in submission order, so pages stay in sequence
+    parts = map_in_process_pool(_convert_pdf_page_range, [file_path] * len(page_ranges), page_ranges)
+    return "".join(parts)
+
 # Convert PDF to LLM-friendly markdown
-def convert_pdf_to_markdown(file_path):
+def convert_pdf_to_markdown(file_path, use_cache=True, parallel=True):
     """
     Convert a PDF file to LLM-friendly markdown using PyMuPDF4LLM
     
     Args:
         file_path: Path to the PDF file
+        use_cache: Reuse a previous conversion of the same file bytes (default: True)
+        parallel: Convert large documents in page ranges across processes (default: True)
     
     Returns:
         str: Markdown content of the PDF or None if conversion failed
@@ -88,27 +335,93 @@ def convert_pdf_to_markdown(file_path):
     try:
         import pymupdf4llm
         
-        # Convert PDF to markdown
-        md_text = pymupdf4llm.to_markdown(file_path)
+        with stage_span("pdf_conversion", file=os.path.basename(file_path)) as span:
+            span["input_bytes"] = os.path.getsize(file_path)
+            cache_key = None
+            if use_cache:
+                cache_key = pdf_markdown_cache.key_for(file_path, pymupdf4llm.version)
+                md_text = pdf_markdown_cache.get(cache_key)
+                span["cache_hit"] = md_text is not None
+                if md_text is not None:
+                    logger.info(f"PDF markdown served from cache: {file_path} ({pdf_markdown_cache.stats()})")
+                    span["output_bytes"] = len(md_text)
+                    return md_text
+            
+            # Convert PDF to markdown
+            if parallel:
+                md_text = convert_pdf_to_markdown_parallel(file_path)
+            else:
+                md_text = pymupdf4llm.to_markdown(file_path)
+            span["output_bytes"] = len(md_text)
+        
+        if cache_key is not None:
+            try:
+                pdf_markdown_cache.put(cache_key, md_text)
+            except OSError as e:
+                logger.warning(f"Warning: Could not cache PDF markdown: {e}")
         
-        print(f"PDF converted to markdown successfully: {file_path}")
-        print(f"Markdown length: {len(md_text)} characters")
+        logger.info(f"PDF converted to markdown successfully: {file_path}")
+        logger.info(f"Markdown length: {len(md_text)} characters")
         return md_text
         
     except ImportError:
-        print("Error: pymupdf4llm is not installed. Install it with: pip install pymupdf4llm")
+        logger.error("Error: pymupdf4llm is not installed. Install it with: pip install pymupdf4llm")
         return None
     except FileNotFoundError:
-        print(f"File not found: {file_path}")
+        logger.error(f"File not found: {file_path}")
         return None
     except Exception as e:
-        print(f"Error converting PDF to markdown: {e}")
+        logger.error(f"Error converting PDF to markdown: {e}")
         return None
 
+# S3 transfer settings for markdown uploads: bodies above S3_MULTIPART_THRESHOLD are
+# sent as concurrent multipart uploads
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.environ.get('S3_MULTIPART_CHUNKSIZE', str(16 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', '8'))
+
+def _markdown_transfer_config():
+    from boto3.s3.transfer import TransferConfig
+    
+    return TransferConfig(
+        multipart_threshold=S3_MULTIPART_THRESHOLD,
+        multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        max_concurrency=S3_MAX_CONCURRENCY,
+        use_threads=True
+    )
+
+# Upload markdown text to S3 from memory
+def upload_markdown_bytes(s3_client, markdown_content, bucket_name, key, content_hash=None):
+    """
+    Encode markdown and upload it from an in-memory buffer
+    
+    Args:
+        s3_client: boto3 S3 client
+        markdown_content: The markdown text content
+        bucket_name: S3 bucket name
+        key: S3 object key
+        content_hash: SHA-256 of the markdown, stored as object metadata (computed if omitted)
+    """
+    import io
+    
+    data = markdown_content.encode('utf-8')
+    content_hash = content_hash or hashlib.sha256(data).hexdigest()
+    with stage_span("s3_upload", key=key, upload_bytes=len(data)):
+        s3_client.upload_fileobj(
+            io.BytesIO(data),
+            bucket_name,
+            key,
+            ExtraArgs={
+                'ContentType': 'text/markdown; charset=utf-8',
+                'Metadata': {CONTENT_HASH_METADATA_KEY: content_hash}
+            },
+            Config=_markdown_transfer_config()
+        )
+
 # Upload markdown content to S3
 def upload_markdown_to_s3(markdown_content, original_filename, bucket_name='ai-agent-knowledge-documents', profile_name='chatbot', region_name='us-east-1'):
     """
-    Save markdown content to a file and upload to S3 bucket
+    Upload markdown content to S3 bucket without writing a local file
     
     Args:
         markdown_content: The markdown text content
@@ -120,9 +433,7 @@ def upload_markdown_to_s3(markdown_content, original_filename, bucket_name='ai-a
     Returns:
         str: S3 URI of the uploaded file or None if upload failed
     """
-    import boto3
     import os
-    import tempfile
     from botocore.exceptions import ClientError
     
     try:
@@ -130,38 +441,364 @@ def upload_markdown_to_s3(markdown_content, original_filename, bucket_name='ai-a
         base_name = os.path.splitext(original_filename)[0]
         md_filename = f"{base_name}.md"
         
-        # Create temporary file to save markdown
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as temp_file:
-            temp_file.write(markdown_content)
-            temp_file_path = temp_file.name
-        
-        # Create S3 client with profile
-        session = boto3.Session(profile_name=profile_name, region_name=region_name)
-        s3_client = session.client('s3')
+        # Get the shared S3 client for this profile
+        s3_client = get_boto3_client('s3', profile_name, region_name)
         
-        # Upload the markdown file
-        s3_client.upload_file(temp_file_path, bucket_name, md_filename)
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        # Upload the markdown straight from memory
+        upload_markdown_bytes(s3_client, markdown_content, bucket_name, md_filename)
         
         s3_uri = f"s3://{bucket_name}/{md_filename}"
-        print(f"Markdown uploaded successfully to {s3_uri}")
+        logger.info(f"Markdown uploaded successfully to {s3_uri}")
         return s3_uri
         
     except ClientError as e:
-        print(f"Error uploading markdown to S3: {e}")
+        logger.error(f"Error uploading markdown to S3: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error uploading markdown: {e}")
+        return None
+
+# Content hashes of the markdown documents saved to the knowledge base buckets. The
+# hash is stored as S3 object metadata and in a local manifest that also tracks whether
+# an ingestion job completed for it, so saving content that is already ingested skips
+# both the upload and the ingestion job.
+CONTENT_HASH_METADATA_KEY = 'content-sha256'
+KB_MANIFEST_PATH = os.environ.get('KB_MANIFEST_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'chatbot', 'kb_manifest.json'))
+
+def markdown_content_hash(markdown_content):
+    """Return the SHA-256 hex digest of the UTF-8 encoded markdown"""
+    return hashlib.sha256(markdown_content.encode('utf-8')).hexdigest()
+
+# S3 object key of the markdown saved for a document
+def markdown_object_key(original_filename):
+    return f"{os.path.splitext(original_filename)[0]}.md"
+
+# Local record of the content hash last uploaded to each S3 object and its ingestion state
+class KnowledgeBaseManifest:
+    """
+    JSON file mapping s3://bucket/key to the SHA-256 of the markdown uploaded there
+    
+    An entry is recorded as pending before the upload and marked ingested once an
+    ingestion job covering it ends COMPLETE; only ingested entries let a save be skipped.
+    The file is rewritten through a temporary file and os.replace. Processes sharing the
+    file may overwrite each other's latest entries; a missing entry falls back to the S3
+    metadata and the data source's ingestion history.
+    
+    Args:
+        manifest_path: JSON file holding the manifest
+    """
+    
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self._entries = None
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        import json
+        
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def get(self, s3_uri):
+        """Return the entry for s3_uri ({'sha256', 'ingested', 'updated_at'}) or None"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(s3_uri)
+        return dict(entry) if entry else None
+    
+    def record(self, s3_uri, content_hash, ingested=False):
+        """Store the content hash uploaded to s3_uri and whether it has been ingested"""
+        self._write(s3_uri, content_hash, ingested, only_if_hash=None)
+    
+    def mark_ingested(self, s3_uri, content_hash):
+        """Mark s3_uri ingested, unless a different content hash was uploaded there since"""
+        self._write(s3_uri, content_hash, True, only_if_hash=content_hash)
+    
+    def _write(self, s3_uri, content_hash, ingested, only_if_hash):
+        import json
+        import time
+        
+        with self._lock:
+            # Merge with entries written by other processes since the last load
+            entries = self._load()
+            current = entries.get(s3_uri)
+            if only_if_hash is not None and current and current['sha256'] != only_if_hash:
+                self._entries = entries
+                return
+            entries[s3_uri] = {'sha256': content_hash, 'ingested': ingested, 'updated_at': time.time()}
+            directory = os.path.dirname(os.path.abspath(self.manifest_path))
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(temp_path, self.manifest_path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            self._entries = entries
+
+kb_manifest = KnowledgeBaseManifest(KB_MANIFEST_PATH)
+
+# Start time of the latest COMPLETE ingestion job of a data source, or None
+def _last_completed_ingestion(knowledge_base_id, data_source_id, profile_name, region_name):
+    bedrock_agent_client = get_boto3_client('bedrock-agent', profile_name, region_name)
+    response = bedrock_agent_client.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['COMPLETE']}],
+        sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+        maxResults=1
+    )
+    summaries = response.get('ingestionJobSummaries', [])
+    return summaries[0].get('startedAt') if summaries else None
+
+# Check whether the markdown for a document is already ingested into the knowledge base
+def find_unchanged_document(markdown_content, original_filename, bucket_name='ai-agent-knowledge-documents',
+                            profile_name='chatbot', region_name='us-east-1', content_hash=None,
+                            knowledge_base_id=None, data_source_id=None):
+    """
+    Compare the markdown's content hash with the local manifest, then with the S3 object metadata
+    
+    A manifest entry counts only once an ingestion job covering it ended COMPLETE. Without
+    an entry, matching S3 metadata counts only if the data source's latest COMPLETE
+    ingestion job started after the object was written, which needs knowledge_base_id
+    and data_source_id.
+    
+    Args:
+        markdown_content: The markdown text content
+        original_filename: Original filename (will be converted to .md)
+        bucket_name: S3 bucket name (default: 'ai-agent-knowledge-documents')
+        profile_name: AWS profile name (default: 'chatbot')
+        region_name: AWS region (default: 'us-east-1')
+        content_hash: Precomputed markdown_content_hash (optional)
+        knowledge_base_id: Knowledge base the bucket is ingested into (optional)
+        data_source_id: Data source of the bucket (optional)
+    
+    Returns:
+        str: S3 URI of the identical, ingested object, or None if it is missing, different,
+            not yet ingested or could not be checked
+    """
+    from botocore.exceptions import ClientError
+    
+    content_hash = content_hash or markdown_content_hash(markdown_content)
+    md_filename = markdown_object_key(original_filename)
+    s3_uri = f"s3://{bucket_name}/{md_filename}"
+    entry = kb_manifest.get(s3_uri)
+    if entry:
+        # A pending entry means the last upload's ingestion failed or never finished
+        return s3_uri if entry['sha256'] == content_hash and entry.get('ingested') else None
+    if not (knowledge_base_id and data_source_id):
+        return None
+    
+    try:
+        s3_client = get_boto3_client('s3', profile_name, region_name)
+        response = s3_client.head_object(Bucket=bucket_name, Key=md_filename)
+        if response.get('Metadata', {}).get(CONTENT_HASH_METADATA_KEY) != content_hash:
+            return None
+        ingested_at = _last_completed_ingestion(knowledge_base_id, data_source_id, profile_name, region_name)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            logger.warning(f"Could not check {s3_uri} for changes: {e}")
         return None
     except Exception as e:
-        print(f"Unexpected error uploading markdown: {e}")
+        logger.warning(f"Could not check {s3_uri} for changes: {e}")
+        return None
+    
+    last_modified = response.get('LastModified')
+    if ingested_at is None or last_modified is None or ingested_at <= last_modified:
         return None
+    kb_manifest.record(s3_uri, content_hash, ingested=True)
+    return s3_uri
+
+# Coalesce ingestion jobs: uploads to the same data source within the debounce window
+# share one start_ingestion_job call, and a batch waits while a job is still running
+INGESTION_DEBOUNCE_SECONDS = float(os.environ.get('INGESTION_DEBOUNCE_SECONDS', '10'))
+INGESTION_BUSY_RETRY_SECONDS = float(os.environ.get('INGESTION_BUSY_RETRY_SECONDS', '30'))
+INGESTION_POLL_INITIAL_SECONDS = float(os.environ.get('INGESTION_POLL_INITIAL_SECONDS', '5'))
+INGESTION_POLL_MAX_SECONDS = float(os.environ.get('INGESTION_POLL_MAX_SECONDS', '60'))
+
+class IngestionCoalescer:
+    """
+    Batch knowledge base ingestion requests per (knowledge_base_id, data_source_id)
+    
+    The first submit for a data source opens a debounce window. Every request submitted
+    before the window closes is served by the same ingestion job. Bedrock rejects
+    overlapping jobs, so when the previous job is still running (or start_ingestion_job
+    raises ConflictException) the batch is retried after busy_retry_seconds.
+    
+    Every started job is polled with exponential backoff until it finishes, and the
+    final job dict is passed to the callbacks registered with add_listener.
+    
+    Args:
+        debounce_seconds: How long to collect requests before starting a job
+        busy_retry_seconds: Delay before retrying while a job is already running
+        poll_initial_seconds: First delay between get_ingestion_job polls
+        poll_max_seconds: Upper bound for the polling delay
+    """
+    
+    RUNNING_STATUSES = ('STARTING', 'IN_PROGRESS', 'STOPPING')
+    
+    def __init__(self, debounce_seconds, busy_retry_seconds, poll_initial_seconds=5, poll_max_seconds=60):
+        self.debounce_seconds = debounce_seconds
+        self.busy_retry_seconds = busy_retry_seconds
+        self.poll_initial_seconds = poll_initial_seconds
+        self.poll_max_seconds = poll_max_seconds
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timers = {}
+        self._last_job_ids = {}
+        self._listeners = []
+    
+    def add_listener(self, callback):
+        """Register callback(job) to be called when an ingestion job finishes"""
+        with self._lock:
+            self._listeners.append(callback)
+    
+    def submit(self, knowledge_base_id, data_source_id, profile_name='chatbot', region_name='us-east-1'):
+        """
+        Request an ingestion job for a data source
+        
+        Returns:
+            concurrent.futures.Future: Resolves to the ingestion job dict that includes this request
+        """
+        from concurrent.futures import Future
+        
+        key = (knowledge_base_id, data_source_id, profile_name, region_name)
+        future = Future()
+        with self._lock:
+            self._pending.setdefault(key, []).append(future)
+            # A key stays in _timers from the first submit until its batch has been started
+            if key not in self._timers:
+                self._schedule(key, self.debounce_seconds)
+        return future
+    
+    def _schedule(self, key, delay):
+        timer = threading.Timer(delay, self._flush, args=(key,))
+        timer.daemon = True
+        self._timers[key] = timer
+        timer.start()
+    
+    def _job_running(self, bedrock_agent_client, key):
+        job_id = self._last_job_ids.get(key)
+        if job_id is None:
+            return False
+        response = bedrock_agent_client.get_ingestion_job(
+            knowledgeBaseId=key[0],
+            dataSourceId=key[1],
+            ingestionJobId=job_id
+        )
+        return response.get('ingestionJob', {}).get('status') in self.RUNNING_STATUSES
+    
+    def _flush(self, key):
+        from botocore.exceptions import ClientError
+        
+        knowledge_base_id, data_source_id, profile_name, region_name = key
+        bedrock_agent_client = get_boto3_client('bedrock-agent', profile_name, region_name)
+        with self._lock:
+            batch = self._pending.pop(key, [])
+        
+        try:
+            if self._job_running(bedrock_agent_client, key):
+                logger.info(f"Ingestion still running for {knowledge_base_id}/{data_source_id}, retrying batch of {len(batch)} later")
+                self._requeue(key, batch)
+                return
+            
+            with stage_span("ingestion_start", knowledge_base_id=knowledge_base_id, batch_size=len(batch)):
+                response = bedrock_agent_client.start_ingestion_job(
+                    knowledgeBaseId=knowledge_base_id,
+                    dataSourceId=data_source_id
+                )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConflictException':
+                logger.info(f"Ingestion job conflict for {knowledge_base_id}/{data_source_id}, retrying batch of {len(batch)} later")
+                self._requeue(key, batch)
+                return
+            logger.error(f"Error starting ingestion job: {e}")
+            self._finish(key, batch, error=e)
+            return
+        except Exception as e:
+            logger.error(f"Unexpected error starting ingestion job: {e}")
+            self._finish(key, batch, error=e)
+            return
+        
+        ingestion_job = response.get('ingestionJob', {})
+        job_id = ingestion_job.get('ingestionJobId', 'unknown')
+        status = ingestion_job.get('status', 'unknown')
+        self._last_job_ids[key] = job_id
+        logger.info(f"✓ Knowledge base sync started for {len(batch)} upload(s) - Job ID: {job_id}, Status: {status}")
+        self._finish(key, batch, job=ingestion_job)
+        
+        watcher = threading.Thread(target=self._watch_job, args=(key, job_id), daemon=True)
+        watcher.start()
+    
+    def _watch_job(self, key, job_id):
+        import time
+        
+        knowledge_base_id, data_source_id, profile_name, region_name = key
+        bedrock_agent_client = get_boto3_client('bedrock-agent', profile_name, region_name)
+        delay = self.poll_initial_seconds
+        while True:
+            time.sleep(delay)
+            try:
+                response = bedrock_agent_client.get_ingestion_job(
+                    knowledgeBaseId=knowledge_base_id,
+                    dataSourceId=data_source_id,
+                    ingestionJobId=job_id
+                )
+            except Exception as e:
+                logger.error(f"Error polling ingestion job {job_id}: {e}")
+            else:
+                job = response.get('ingestionJob', {})
+                if job.get('status') not in self.RUNNING_STATUSES:
+                    logger.info(f"✓ Ingestion job {job_id} finished with status {job.get('status')}")
+                    break
+            delay = min(delay * 2, self.poll_max_seconds)
+        
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"Ingestion listener failed: {e}")
+    
+    def _requeue(self, key, batch):
+        with self._lock:
+            self._pending[key] = batch + self._pending.get(key, [])
+            self._schedule(key, self.busy_retry_seconds)
+    
+    def _finish(self, key, batch, job=None, error=None):
+        for future in batch:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(job)
+        # Requests that arrived while this batch was starting form the next batch
+        with self._lock:
+            if self._pending.get(key):
+                self._schedule(key, self.busy_retry_seconds)
+            else:
+                self._timers.pop(key, None)
+
+ingestion_coalescer = IngestionCoalescer(INGESTION_DEBOUNCE_SECONDS, INGESTION_BUSY_RETRY_SECONDS,
+                                         INGESTION_POLL_INITIAL_SECONDS, INGESTION_POLL_MAX_SECONDS)
 
 # Upload markdown to S3 and sync Bedrock Knowledge Base (combined function)
 def upload_markdown_and_sync_kb(markdown_content, original_filename, knowledge_base_id, data_source_id, 
-                                  bucket_name='ai-agent-knowledge-documents', profile_name='chatbot', region_name='us-east-1'):
+                                  bucket_name='ai-agent-knowledge-documents', profile_name='chatbot', region_name='us-east-1',
+                                  skip_unchanged=True):
     """
     Upload markdown content to S3 and sync Bedrock Knowledge Base in one operation
     
+    The content hash is recorded in the manifest as pending; call
+    kb_manifest.mark_ingested once the ingestion job ends COMPLETE.
+    
     Args:
         markdown_content: The markdown text content
         original_filename: Original PDF filename (will be converted to .md)
@@ -170,61 +807,59 @@ def upload_markdown_and_sync_kb(markdown_content, original_filename, knowledge_b
         bucket_name: S3 bucket name (default: 'ai-agent-knowledge-documents')
         profile_name: AWS profile name (default: 'chatbot')
         region_name: AWS region (default: 'us-east-1')
+        skip_unchanged: Skip content that is already ingested (False forces the upload and sync)
     
     Returns:
-        dict: {'s3_uri': str, 'sync_job': dict} or None if failed
+        dict: {'s3_uri': str, 'sync_job': Future resolving to the ingestion job dict, 'unchanged': bool}
+            or None if failed. When the same content is already ingested nothing is
+            uploaded, sync_job is None and unchanged is True.
     """
-    import boto3
-    import os
-    import tempfile
     from botocore.exceptions import ClientError
     
     try:
-        # Create markdown filename from original PDF name
-        base_name = os.path.splitext(original_filename)[0]
-        md_filename = f"{base_name}.md"
-        
-        # Create temporary file to save markdown
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as temp_file:
-            temp_file.write(markdown_content)
-            temp_file_path = temp_file.name
+        md_filename = markdown_object_key(original_filename)
+        content_hash = markdown_content_hash(markdown_content)
         
-        # Create session and clients
-        session = boto3.Session(profile_name=profile_name, region_name=region_name)
-        s3_client = session.client('s3')
-        bedrock_agent_client = session.client('bedrock-agent')
-        
-        # Upload the markdown file to S3
-        s3_client.upload_file(temp_file_path, bucket_name, md_filename)
+        # Unchanged content: skip the upload and the ingestion job
+        unchanged_uri = skip_unchanged and find_unchanged_document(
+            markdown_content, original_filename, bucket_name, profile_name, region_name, content_hash,
+            knowledge_base_id=knowledge_base_id, data_source_id=data_source_id
+        )
+        if unchanged_uri:
+            logger.info(f"✓ {unchanged_uri} is already up to date, skipping upload and sync")
+            return {
+                's3_uri': unchanged_uri,
+                'sync_job': None,
+                'unchanged': True
+            }
         
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        # Get the shared S3 client for this profile
+        s3_client = get_boto3_client('s3', profile_name, region_name)
         
+        # Pending until ingestion completes, so a failed or interrupted save is not skipped next time
         s3_uri = f"s3://{bucket_name}/{md_filename}"
-        print(f"✓ Markdown uploaded to {s3_uri}")
+        kb_manifest.record(s3_uri, content_hash)
         
-        # Start ingestion job to sync knowledge base
-        response = bedrock_agent_client.start_ingestion_job(
-            knowledgeBaseId=knowledge_base_id,
-            dataSourceId=data_source_id
-        )
+        # Upload the markdown to S3 straight from memory
+        upload_markdown_bytes(s3_client, markdown_content, bucket_name, md_filename, content_hash)
+        logger.info(f"✓ Markdown uploaded to {s3_uri}")
         
-        ingestion_job = response.get('ingestionJob', {})
-        job_id = ingestion_job.get('ingestionJobId', 'unknown')
-        status = ingestion_job.get('status', 'unknown')
+        # Queue the sync; uploads within the debounce window share one ingestion job
+        sync_job = ingestion_coalescer.submit(knowledge_base_id, data_source_id, profile_name, region_name)
         
-        print(f"✓ Knowledge base sync started - Job ID: {job_id}, Status: {status}")
+        logger.info(f"✓ Knowledge base sync queued for {knowledge_base_id}/{data_source_id}")
         
         return {
             's3_uri': s3_uri,
-            'sync_job': ingestion_job
+            'sync_job': sync_job,
+            'unchanged': False
         }
         
     except ClientError as e:
-        print(f"Error uploading/syncing: {e}")
+        logger.error(f"Error uploading/syncing: {e}")
         return None
     except Exception as e:
-        print(f"Unexpected error: {e}")
+        logger.error(f"Unexpected error: {e}")
         return None
 
 # Sync Bedrock Knowledge Base
@@ -241,13 +876,11 @@ def sync_bedrock_knowledge_base(knowledge_base_id, data_source_id, profile_name=
     Returns:
         dict: Ingestion job details or None if sync failed
     """
-    import boto3
     from botocore.exceptions import ClientError
     
     try:
-        # Create Bedrock Agent client with profile
-        session = boto3.Session(profile_name=profile_name, region_name=region_name)
-        bedrock_agent_client = session.client('bedrock-agent')
+        # Get the shared Bedrock Agent client for this profile
+        bedrock_agent_client = get_boto3_client('bedrock-agent', profile_name, region_name)
         
         # Start ingestion job
         response = bedrock_agent_client.start_ingestion_job(
@@ -259,14 +892,14 @@ def sync_bedrock_knowledge_base(knowledge_base_id, data_source_id, profile_name=
         job_id = ingestion_job.get('ingestionJobId', 'unknown')
         status = ingestion_job.get('status', 'unknown')
         
-        print(f"Knowledge base sync started - Job ID: {job_id}, Status: {status}")
+        logger.info(f"Knowledge base sync started - Job ID: {job_id}, Status: {status}")
         return ingestion_job
         
     except ClientError as e:
-        print(f"Error syncing Bedrock knowledge base: {e}")
+        logger.error(f"Error syncing Bedrock knowledge base: {e}")
         return None
     except Exception as e:
-        print(f"Unexpected error syncing knowledge base: {e}")
+        logger.error(f"Unexpected error syncing knowledge base: {e}")
         return None
 
 # Detect GitHub URLs in text
@@ -305,187 +938,820 @@ def detect_github_url(text):
     
     return urls
 
+# Extract all classes (with methods and docstrings) from a Python file
+def extract_classes_from_file(file_path):
+    """Extract all classes from a Python file"""
+    import ast
+    
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        tree = ast.parse(content)
+        classes = []
+        
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                class_info = {
+                    'name': node.name,
+                    'docstring': ast.get_docstring(node) or '',
+                    'methods': [],
+                    'bases': [base.id if isinstance(base, ast.Name) else str(base) for base in node.bases]
+                }
+                
+                # Extract methods
+                for item in node.body:
+                    if isinstance(item, ast.FunctionDef):
+                        method_info = {
+                            'name': item.name,
+                            'docstring': ast.get_docstring(item) or '',
+                            'args': [arg.arg for arg in item.args.args]
+                        }
+                        class_info['methods'].append(method_info)
+                
+                classes.append(class_info)
+        
+        return classes
+    except Exception as e:
+        logger.error(f"Error parsing {file_path}: {e}")
+        return []
+
+# Parallel AST extraction settings: repositories with fewer than AST_PARALLEL_MIN_FILES
+# files to parse are handled serially
+AST_BATCH_SIZE = int(os.environ.get('AST_BATCH_SIZE', '64'))
+AST_PARALLEL_MIN_FILES = int(os.environ.get('AST_PARALLEL_MIN_FILES', '200'))
+
+# Parse a batch of Python files (runs inside a worker process)
+def _extract_classes_batch(file_paths):
+    return [extract_classes_from_file(file_path) for file_path in file_paths]
+
+# Extract classes from many Python files across a process pool
+def extract_classes_from_files(file_paths, max_workers=None, batch_size=None, min_files=None):
+    """
+    Run extract_classes_from_file over many files, in batches across a process pool
+    
+    Args:
+        file_paths: Paths of the Python files to parse
+        max_workers: Set to 1 to parse serially (default: PROCESS_POOL_WORKERS, the shared pool's size)
+        batch_size: Files sent to a worker per task (default: AST_BATCH_SIZE)
+        min_files: File count below which parsing stays serial (default: AST_PARALLEL_MIN_FILES)
+    
+    Returns:
+        list: Class lists in the same order as file_paths
+    """
+    file_paths = [str(file_path) for file_path in file_paths]
+    max_workers = max_workers or PROCESS_POOL_WORKERS
+    batch_size = batch_size or AST_BATCH_SIZE
+    min_files = AST_PARALLEL_MIN_FILES if min_files is None else min_files
+    
+    if len(file_paths) < min_files or max_workers < 2:
+        return _extract_classes_batch(file_paths)
+    
+    batches = [file_paths[start:start + batch_size] for start in range(0, len(file_paths), batch_size)]
+    logger.info(f"Parsing {len(file_paths)} files in {len(batches)} batch(es) on the shared process pool")
+    
+    # map returns batches in submission order, keeping results aligned with file_paths
+    results = []
+    for batch_result in map_in_process_pool(_extract_classes_batch, batches):
+        results.extend(batch_result)
+    return results
+
+# Emit repository markdown section by section
+def iter_repo_markdown(repo_name, repo_url, files_data):
+    """
+    Yield markdown documentation for parsed repository data, one section at a time
+    
+    Args:
+        repo_name: Repository name used in the title
+        repo_url: Repository URL
+        files_data: Mapping of relative file path to the classes found in it
+    
+    Yields:
+        str: Consecutive pieces of the markdown document
+    """
+    yield f"# Repository: {repo_name}\n\n**Source:** {repo_url}\n\n---\n\n## Table of Contents\n\n"
+    
+    # Generate TOC
+    for file_path, classes in files_data.items():
+        if classes:
+            toc = [f"- [{file_path}](#{file_path.replace('/', '').replace('.', '').replace('_', '-')})\n"]
+            for cls in classes:
+                toc.append(f"  - [{cls['name']}](#{cls['name'].lower()})\n")
+            yield "".join(toc)
+    
+    yield "\n---\n\n"
+    
+    # Generate detailed documentation
+    for file_path, classes in files_data.items():
+        if not classes:
+            continue
+        
+        yield f"## File: `{file_path}`\n\n"
+        
+        for cls in classes:
+            section = [f"### Class: `{cls['name']}`\n\n"]
+            
+            # Base classes
+            if cls['bases']:
+                section.append(f"**Inherits from:** {', '.join(cls['bases'])}\n\n")
+            
+            # Class docstring
+            if cls['docstring']:
+                section.append(f"**Description:**\n\n{cls['docstring']}\n\n")
+            
+            # Methods
+            if cls['methods']:
+                section.append("**Methods:**\n\n")
+                for method in cls['methods']:
+                    args_str = ', '.join(method['args'])
+                    section.append(f"#### `{method['name']}({args_str})`\n\n")
+                    if method['docstring']:
+                        section.append(f"{method['docstring']}\n\n")
+                    else:
+                        section.append("*No documentation available*\n\n")
+            
+            section.append("---\n\n")
+            yield "".join(section)
+
+# Generate repository markdown as a single string
+def generate_repo_markdown(repo_name, repo_url, files_data):
+    """Generate markdown documentation from parsed data"""
+    return "".join(iter_repo_markdown(repo_name, repo_url, files_data))
+
+# Write repository markdown to an open text file without building the whole string
+def write_repo_markdown(file_obj, repo_name, repo_url, files_data):
+    """
+    Stream repository markdown into a writable text file object
+    
+    Returns:
+        int: Number of characters written
+    """
+    written = 0
+    for chunk in iter_repo_markdown(repo_name, repo_url, files_data):
+        file_obj.write(chunk)
+        written += len(chunk)
+    return written
+
+# Saved clones and their cache files (<repo>.cache.json, <repo>.md) live here
+SAVED_REPO_DIR = os.environ.get('SAVED_REPO_DIR', r'C:\Users\tirta.gunawan\Documents\GitHub\savedRepo')
+
+# Python files parsed from a repository: .gitignore and REPO_EXCLUDE_PATTERNS (gitignore
+# syntax, comma-separated) prune the walk, oversized files are skipped and the walk
+# stops once the file or byte budget is spent (0 disables a limit)
+REPO_EXCLUDE_PATTERNS = tuple(
+    pattern.strip() for pattern in os.environ.get('REPO_EXCLUDE_PATTERNS', ','.join(DEFAULT_EXCLUDE_PATTERNS)).split(',')
+)
+REPO_USE_GITIGNORE = os.environ.get('REPO_USE_GITIGNORE', 'true').lower() in ('1', 'true', 'yes')
+REPO_MAX_FILE_BYTES = int(os.environ.get('REPO_MAX_FILE_BYTES', str(512 * 1024)))
+REPO_MAX_FILES = int(os.environ.get('REPO_MAX_FILES', '10000'))
+REPO_MAX_TOTAL_BYTES = int(os.environ.get('REPO_MAX_TOTAL_BYTES', str(100 * 1024 * 1024)))
+repo_file_filter = RepoFileFilter(
+    include_patterns=('*.py',),
+    exclude_patterns=REPO_EXCLUDE_PATTERNS,
+    use_gitignore=REPO_USE_GITIGNORE,
+    max_file_bytes=REPO_MAX_FILE_BYTES,
+    max_files=REPO_MAX_FILES,
+    max_total_bytes=REPO_MAX_TOTAL_BYTES
+)
+
+# Resolve the commit SHA the remote HEAD points to
+def get_remote_head_sha(repo_url):
+    """
+    Look up the remote HEAD commit with git ls-remote (no clone needed)
+    
+    Args:
+        repo_url: Git repository URL
+    
+    Returns:
+        str: Commit SHA or None if it could not be resolved
+    """
+    import subprocess
+    
+    try:
+        result = subprocess.run(
+            ['git', 'ls-remote', repo_url, 'HEAD'],
+            capture_output=True,
+            text=True,
+            timeout=60
+        )
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        logger.warning(f"Could not resolve remote HEAD for {repo_url}: {e}")
+        return None
+    
+    if result.returncode != 0 or not result.stdout.strip():
+        logger.warning(f"Could not resolve remote HEAD for {repo_url}: {result.stderr.strip()}")
+        return None
+    return result.stdout.split()[0]
+
+# Repository fetch mode: 'partial' makes a blobless clone and checks out only the files
+# matching REPO_SPARSE_PATTERNS, so the server sends just those blobs; 'full' downloads
+# every blob of HEAD. Servers without partial clone support fall back to a full clone.
+REPO_CLONE_MODE = os.environ.get('REPO_CLONE_MODE', 'partial').lower()
+REPO_SPARSE_PATTERNS = tuple(os.environ.get('REPO_SPARSE_PATTERNS', '*.py,.gitignore').split(','))
+
+# git ignores --filter and --depth for plain local paths; use a file:// URL instead
+def _clone_source(repo_url):
+    from pathlib import Path
+    
+    if '://' not in repo_url and os.path.isdir(repo_url):
+        return Path(repo_url).resolve().as_uri()
+    return repo_url
+
+# Size in bytes of the files under a directory
+def _directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+# Shallow-clone a repository, fetching only the blobs of the sparse patterns when possible
+def _clone_repository(repo_url, target_dir):
+    """
+    Clone repo_url into target_dir (depth 1), preferring a blobless partial clone with a
+    non-cone sparse checkout of REPO_SPARSE_PATTERNS
+    
+    Args:
+        repo_url: Git repository URL or local path
+        target_dir: Directory to clone into (must not exist)
+    
+    Returns:
+        str: 'partial', 'full' (also when the server ignored the filter) or None if cloning failed
+    """
+    import shutil
+    import subprocess
+    
+    source = _clone_source(repo_url)
+    if REPO_CLONE_MODE == 'partial':
+        steps = (
+            ['git', 'clone', '--depth', '1', '--filter=blob:none', '--no-checkout', source, target_dir],
+            ['git', '-C', target_dir, 'sparse-checkout', 'set', '--no-cone', *REPO_SPARSE_PATTERNS],
+            ['git', '-C', target_dir, 'checkout']
+        )
+        filtered = True
+        for command in steps:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=300)
+            if result.returncode != 0:
+                logger.warning(f"Partial clone failed, falling back to a full clone: {result.stderr.strip()}")
+                break
+            if 'filtering not recognized' in result.stderr:
+                # The server sent every blob anyway; the sparse checkout still applies
+                filtered = False
+        else:
+            if not filtered:
+                logger.info(f"Server does not support partial clone, fetched all blobs of {repo_url}")
+            return 'partial' if filtered else 'full'
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+    
+    result = subprocess.run(
+        ['git', 'clone', '--depth', '1', source, target_dir],
+        capture_output=True,
+        text=True,
+        timeout=300
+    )
+    if result.returncode != 0:
+        logger.error(f"Error cloning repository: {result.stderr}")
+        return None
+    return 'full'
+
+# Fetch the remote HEAD into an existing shallow clone and list the files that changed
+def _fetch_repo_changes(repo_dir, old_sha):
+    """Update repo_dir to the remote HEAD; return changed paths or None if a full clone is needed"""
+    import subprocess
+    
+    def git(*args):
+        return subprocess.run(['git', '-C', repo_dir, *args], capture_output=True, text=True, timeout=300)
+    
+    fetch_result = git('fetch', '--depth', '1', 'origin', 'HEAD')
+    if fetch_result.returncode != 0:
+        logger.warning(f"Incremental fetch failed: {fetch_result.stderr}")
+        return None
+    
+    # --no-renames: rename detection would download the blobs of a partial clone
+    diff_result = git('diff', '--name-only', '--no-renames', old_sha, 'FETCH_HEAD')
+    if diff_result.returncode != 0:
+        logger.warning(f"Could not diff {old_sha} against fetched HEAD: {diff_result.stderr}")
+        return None
+    
+    reset_result = git('reset', '--hard', 'FETCH_HEAD')
+    if reset_result.returncode != 0:
+        logger.warning(f"Could not check out fetched HEAD: {reset_result.stderr}")
+        return None
+    
+    return set(line for line in diff_result.stdout.splitlines() if line)
+
+# Load the cache file of a saved repository
+def _load_repo_cache(cache_path, repo_url):
+    import json
+    
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if cache.get('repo_url') != repo_url:
+        return None
+    return cache
+
+# Atomically write the cache file of a saved repository and move its freshly written
+# markdown file into place
+def _save_repo_cache(cache_path, markdown_path, cache, markdown_temp_path):
+    import json
+    
+    os.replace(markdown_temp_path, markdown_path)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(temp_path, cache_path)
+
+# Read a markdown file into one string without an intermediate bytes copy
+def _read_markdown_file(path):
+    import mmap
+    
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        # Decoding straight from the mapping keeps a single in-memory copy of the document
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return str(mapped, 'utf-8')
+
+# Per-repository lock on the saved clone: a thread lock inside the process plus an
+# exclusive lock on a lock file for the other worker processes
+_saved_repo_locks = {}
+_saved_repo_locks_lock = threading.Lock()
+
+def _lock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        
+        lock_file.seek(0)
+        while True:
+            # LK_LOCK gives up after about 10 seconds; keep waiting
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+def _unlock_file(lock_file):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def _saved_repo_lock(lock_path):
+    with _saved_repo_locks_lock:
+        thread_lock = _saved_repo_locks.setdefault(lock_path, threading.Lock())
+    with thread_lock, open(lock_path, 'a+b') as lock_file:
+        _lock_file(lock_file)
+        try:
+            yield
+        finally:
+            _unlock_file(lock_file)
+
 # Convert GitHub repository to markdown by parsing Python files
-def convert_github_repo_to_markdown(repo_url, temp_dir=None):
+def convert_github_repo_to_markdown(repo_url, temp_dir=None, file_filter=None):
     """
     Clone a GitHub repository and convert it to markdown format by parsing Python files
     and extracting all classes with their methods and docstrings
     
+    Without temp_dir the clone is kept in SAVED_REPO_DIR together with a cache keyed by
+    the remote HEAD SHA: an unchanged SHA returns the cached markdown without cloning,
+    and a new SHA fetches only the delta and re-parses just the changed files. Clones
+    follow REPO_CLONE_MODE: by default only the blobs of Python sources are downloaded.
+    
     Args:
         repo_url: GitHub repository URL
-        temp_dir: Optional temporary directory to clone into
+        temp_dir: Optional temporary directory to clone into (bypasses the cache)
+        file_filter: RepoFileFilter selecting the files to parse (default: repo_file_filter)
     
     Returns:
         str: Markdown content of the repository or None if conversion failed
     """
-    import os
-    import tempfile
+    if temp_dir is not None:
+        return _convert_github_repo(repo_url, temp_dir, file_filter)
+    
+    # One conversion per saved repository at a time: concurrent requests for the same URL
+    # would delete and re-clone the directory under each other. Waiters then find the
+    # cache up to date.
+    repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+    try:
+        os.makedirs(SAVED_REPO_DIR, exist_ok=True)
+        with _saved_repo_lock(os.path.join(SAVED_REPO_DIR, f"{repo_name}.lock")):
+            return _convert_github_repo(repo_url, None, file_filter)
+    except OSError as e:
+        logger.error(f"Could not lock saved repository {repo_name}: {e}")
+        return None
+
+def _convert_github_repo(repo_url, temp_dir, file_filter):
     import shutil
     import subprocess
-    import ast
     from pathlib import Path
     
     temp_dir_created = False
     
-    def extract_classes_from_file(file_path):
-        """Extract all classes from a Python file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            tree = ast.parse(content)
-            classes = []
-            
-            for node in ast.walk(tree):
-                if isinstance(node, ast.ClassDef):
-                    class_info = {
-                        'name': node.name,
-                        'docstring': ast.get_docstring(node) or '',
-                        'methods': [],
-                        'bases': [base.id if isinstance(base, ast.Name) else str(base) for base in node.bases]
-                    }
-                    
-                    # Extract methods
-                    for item in node.body:
-                        if isinstance(item, ast.FunctionDef):
-                            method_info = {
-                                'name': item.name,
-                                'docstring': ast.get_docstring(item) or '',
-                                'args': [arg.arg for arg in item.args.args]
-                            }
-                            class_info['methods'].append(method_info)
-                    
-                    classes.append(class_info)
-            
-            return classes
-        except Exception as e:
-            print(f"Error parsing {file_path}: {e}")
-            return []
-    
-    def generate_markdown(repo_name, repo_url, files_data):
-        """Generate markdown documentation from parsed data"""
-        md = f"# Repository: {repo_name}\n\n"
-        md += f"**Source:** {repo_url}\n\n"
-        md += "---\n\n"
-        md += "## Table of Contents\n\n"
-        
-        # Generate TOC
-        for file_path, classes in files_data.items():
-            if classes:
-                md += f"- [{file_path}](#{file_path.replace('/', '').replace('.', '').replace('_', '-')})\n"
-                for cls in classes:
-                    md += f"  - [{cls['name']}](#{cls['name'].lower()})\n"
-        
-        md += "\n---\n\n"
-        
-        # Generate detailed documentation
-        for file_path, classes in files_data.items():
-            if not classes:
-                continue
-            
-            md += f"## File: `{file_path}`\n\n"
-            
-            for cls in classes:
-                md += f"### Class: `{cls['name']}`\n\n"
-                
-                # Base classes
-                if cls['bases']:
-                    md += f"**Inherits from:** {', '.join(cls['bases'])}\n\n"
-                
-                # Class docstring
-                if cls['docstring']:
-                    md += f"**Description:**\n\n{cls['docstring']}\n\n"
-                
-                # Methods
-                if cls['methods']:
-                    md += "**Methods:**\n\n"
-                    for method in cls['methods']:
-                        args_str = ', '.join(method['args'])
-                        md += f"#### `{method['name']}({args_str})`\n\n"
-                        if method['docstring']:
-                            md += f"{method['docstring']}\n\n"
-                        else:
-                            md += "*No documentation available*\n\n"
-                
-                md += "---\n\n"
-        
-        return md
-    
     try:
+        repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+        repo_cache = None
+        changed_files = None  # None means every file is parsed
+        use_repo_cache = temp_dir is None
+        
         # Use permanent directory if not provided
-        if temp_dir is None:
-            repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
-            base_dir = r'C:\Users\tirta.gunawan\Documents\GitHub\savedRepo'
+        if use_repo_cache:
+            base_dir = SAVED_REPO_DIR
             os.makedirs(base_dir, exist_ok=True)
             temp_dir = os.path.join(base_dir, repo_name)
             temp_dir_created = False  # Don't delete permanent directory
+            cache_path = os.path.join(base_dir, f"{repo_name}.cache.json")
+            markdown_path = os.path.join(base_dir, f"{repo_name}.md")
+            
+            repo_cache = _load_repo_cache(cache_path, repo_url)
+            remote_sha = get_remote_head_sha(repo_url)
+            if repo_cache and remote_sha and repo_cache.get('head_sha') == remote_sha and os.path.exists(markdown_path):
+                logger.info(f"Repository unchanged at {remote_sha[:12]}, using cached markdown: {markdown_path}")
+                return _read_markdown_file(markdown_path)
+            
+            # Known clone at an older commit: fetch only the delta
+            if repo_cache and remote_sha and os.path.isdir(os.path.join(temp_dir, '.git')):
+                logger.info(f"Updating saved clone {repo_cache['head_sha'][:12]} -> {remote_sha[:12]}")
+                with stage_span("repo_clone", repo=repo_name, mode="incremental") as span:
+                    changed_files = _fetch_repo_changes(temp_dir, repo_cache['head_sha'])
+                    if changed_files is None:
+                        span["outcome"] = "error"
+                    else:
+                        span["changed_files"] = len(changed_files)
             
             # Remove existing directory if it exists
-            if os.path.exists(temp_dir):
-                print(f"Removing existing directory: {temp_dir}")
+            if changed_files is None and os.path.exists(temp_dir):
+                logger.info(f"Removing existing directory: {temp_dir}")
                 shutil.rmtree(temp_dir)
         
-        print(f"Cloning repository: {repo_url}")
-        
-        # Clone the repository
-        clone_result = subprocess.run(
-            ['git', 'clone', '--depth', '1', repo_url, temp_dir],
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
-        
-        if clone_result.returncode != 0:
-            print(f"Error cloning repository: {clone_result.stderr}")
-            if temp_dir_created and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
-            return None
+        if changed_files is None:
+            logger.info(f"Cloning repository: {repo_url}")
+            
+            # Clone the repository (only Python blobs in partial mode)
+            with stage_span("repo_clone", repo=repo_name, mode=REPO_CLONE_MODE) as span:
+                clone_mode = _clone_repository(repo_url, temp_dir)
+                if clone_mode is None:
+                    span["outcome"] = "error"
+                else:
+                    span["clone_mode"] = clone_mode
+                    span["git_bytes"] = _directory_bytes(os.path.join(temp_dir, '.git'))
+            
+            if clone_mode is None:
+                if temp_dir_created and os.path.exists(temp_dir):
+                    shutil.rmtree(temp_dir)
+                return None
+            
+            logger.info(f"Repository cloned successfully to {temp_dir} ({clone_mode} clone)")
+        else:
+            logger.info(f"Fetched {len(changed_files)} changed file(s)")
         
-        print(f"Repository cloned successfully to {temp_dir}")
+        # Select the Python files to parse; unchanged files reuse the cached symbol table
+        logger.info("Parsing Python files and extracting classes...")
+        with stage_span("repo_filter", repo=repo_name) as span:
+            selection = (file_filter or repo_file_filter).select(temp_dir)
+            span["selected_files"] = len(selection['files'])
+            span["selected_bytes"] = selection['total_bytes']
+            span["skipped"] = sum(len(paths) for paths in selection['skipped'].values())
+            span["truncated"] = selection['truncated']
+        logger.info(f"Selected {len(selection['files'])} Python file(s) - skipped {describe_skipped(selection)}")
+        python_files = [Path(file_path) for file_path in selection['files']]
+        cached_symbols = repo_cache.get('symbols', {}) if repo_cache and changed_files is not None else {}
         
-        # Find all Python files
-        print("Parsing Python files and extracting classes...")
-        python_files = list(Path(temp_dir).rglob('*.py'))
+        symbol_keys = [py_file.relative_to(temp_dir).as_posix() for py_file in python_files]
+        to_parse = [py_file for py_file, symbol_key in zip(python_files, symbol_keys)
+                    if symbol_key not in cached_symbols or symbol_key in changed_files]
+        with stage_span("ast_parse", repo=repo_name, parsed_files=len(to_parse), total_files=len(python_files)):
+            parsed = iter(extract_classes_from_files(to_parse))
         
         files_data = {}
-        for py_file in python_files:
+        symbols = {}
+        for py_file, symbol_key in zip(python_files, symbol_keys):
             relative_path = str(py_file.relative_to(temp_dir))
-            classes = extract_classes_from_file(py_file)
+            if symbol_key in cached_symbols and symbol_key not in changed_files:
+                classes = cached_symbols[symbol_key]
+            else:
+                classes = next(parsed)
+            symbols[symbol_key] = classes
             if classes:
                 files_data[relative_path] = classes
+        logger.info(f"Parsed {len(to_parse)} of {len(python_files)} Python file(s)")
         
-        # Generate markdown
-        repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
-        markdown_text = generate_markdown(repo_name, repo_url, files_data)
+        # Stream the markdown into a file (next to the saved markdown so it can be moved
+        # into place), then read it back once: the document is never held twice in memory
+        fd, markdown_temp_path = tempfile.mkstemp(dir=base_dir if use_repo_cache else None, suffix='.md.tmp')
+        try:
+            with stage_span("markdown_generation", repo=repo_name) as span:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    write_repo_markdown(f, repo_name, repo_url, files_data)
+                span["output_bytes"] = os.path.getsize(markdown_temp_path)
+            markdown_text = _read_markdown_file(markdown_temp_path)
+            
+            # Record the checked-out commit so the next request can skip or diff against it
+            if use_repo_cache:
+                head_result = subprocess.run(
+                    ['git', '-C', temp_dir, 'rev-parse', 'HEAD'],
+                    capture_output=True,
+                    text=True,
+                    timeout=60
+                )
+                if head_result.returncode == 0:
+                    try:
+                        _save_repo_cache(cache_path, markdown_path, {
+                            'repo_url': repo_url,
+                            'head_sha': head_result.stdout.strip(),
+                            'symbols': symbols
+                        }, markdown_temp_path)
+                    except OSError as e:
+                        logger.warning(f"Warning: Could not write repository cache: {e}")
+        finally:
+            if os.path.exists(markdown_temp_path):
+                os.unlink(markdown_temp_path)
         
         # Keep the cloned repository (no cleanup for permanent directory)
         if not temp_dir_created:
-            print(f"Repository saved at: {temp_dir}")
+            logger.info(f"Repository saved at: {temp_dir}")
         else:
             # Clean up only if using custom temp directory
             try:
                 shutil.rmtree(temp_dir)
-                print(f"Cleaned up temporary directory: {temp_dir}")
+                logger.info(f"Cleaned up temporary directory: {temp_dir}")
             except Exception as e:
-                print(f"Warning: Could not clean up temp directory: {e}")
+                logger.warning(f"Warning: Could not clean up temp directory: {e}")
         
-        print(f"Repository converted to markdown: {len(markdown_text)} characters")
-        print(f"Found {sum(len(classes) for classes in files_data.values())} classes")
+        logger.info(f"Repository converted to markdown: {len(markdown_text)} characters")
+        logger.info(f"Found {sum(len(classes) for classes in files_data.values())} classes")
         return markdown_text
         
     except subprocess.TimeoutExpired as e:
-        print(f"Error: Operation timed out - {e}")
+        logger.error(f"Error: Operation timed out - {e}")
         if temp_dir_created and temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         return None
     except FileNotFoundError as e:
-        print(f"Error: Required command not found - {e}")
-        print("Please ensure git is installed: https://git-scm.com/downloads")
+        logger.error(f"Error: Required command not found - {e}")
+        logger.error("Please ensure git is installed: https://git-scm.com/downloads")
         if temp_dir_created and temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
         return None
     except Exception as e:
-        print(f"Error converting repository to markdown: {e}")
+        logger.error(f"Error converting repository to markdown: {e}")
         if temp_dir_created and temp_dir and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
-        return None
\ No newline at end of file
+        return None
+# Split markdown into chunks along paragraph boundaries
+def chunk_markdown(text, chunk_chars=1500):
+    """
+    Split markdown into chunks of at most roughly chunk_chars characters
+    
+    Paragraphs are kept whole where possible; a paragraph longer than chunk_chars is
+    cut into chunk_chars-sized pieces.
+    
+    Args:
+        text: Markdown text
+        chunk_chars: Target maximum chunk size in characters (default: 1500)
+    
+    Returns:
+        list: Chunk strings in document order
+    """
+    chunks = []
+    current = []
+    current_len = 0
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and current_len + len(paragraph) + 2 > chunk_chars:
+            chunks.append('\n\n'.join(current))
+            current, current_len = [], 0
+        while len(paragraph) > chunk_chars:
+            chunks.append(paragraph[:chunk_chars])
+            paragraph = paragraph[chunk_chars:]
+        current.append(paragraph)
+        current_len += len(paragraph) + 2
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+def _tokenize(text):
+    import re
+    return re.findall(r'[a-z0-9_]+', text.lower())
+
+# In-memory BM25 index over document chunks
+class DocumentIndex:
+    """
+    BM25 index over chunks of converted documents (PDF and repository markdown)
+    
+    Documents are identified by a source id (a content hash), so adding the same
+    document again on a later turn is a no-op.
+    
+    Args:
+        chunk_chars: Target chunk size in characters
+        k1: BM25 term frequency saturation
+        b: BM25 length normalization
+    """
+    
+    def __init__(self, chunk_chars=1500, k1=1.5, b=0.75):
+        self.chunk_chars = chunk_chars
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        self.chunk_lengths = []
+        self.postings = {}
+        self.source_ids = set()
+        self.total_length = 0
+        self._lock = threading.Lock()
+    
+    def add_document(self, source_id, title, text):
+        """
+        Chunk and index a document unless source_id is already indexed
+        
+        Returns:
+            bool: True if the document was indexed, False if it was already present
+        """
+        from collections import Counter
+        
+        with self._lock:
+            if source_id in self.source_ids:
+                return False
+            self.source_ids.add(source_id)
+            for chunk in chunk_markdown(text, self.chunk_chars):
+                term_counts = Counter(_tokenize(chunk))
+                chunk_index = len(self.chunks)
+                self.chunks.append({'title': title, 'text': chunk})
+                length = sum(term_counts.values())
+                self.chunk_lengths.append(length)
+                self.total_length += length
+                for term, count in term_counts.items():
+                    self.postings.setdefault(term, []).append((chunk_index, count))
+            return True
+    
+    def search(self, query, top_k=8):
+        """Return up to top_k (score, chunk) pairs ordered by BM25 score"""
+        import heapq
+        import math
+        
+        with self._lock:
+            chunk_count = len(self.chunks)
+            if not chunk_count:
+                return []
+            avg_length = self.total_length / chunk_count or 1
+            scores = {}
+            for term in set(_tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_index, count in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self.chunk_lengths[chunk_index] / avg_length)
+                    scores[chunk_index] = scores.get(chunk_index, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(score, self.chunks[chunk_index]) for chunk_index, score in best]
+    
+    def select_context(self, query, top_k=8, char_budget=12000):
+        """
+        Pick the chunks to send with a question, within char_budget characters
+        
+        Everything is returned in document order when it fits the budget. Otherwise the
+        top_k BM25 matches are used, falling back to the first chunks when the query
+        matches nothing.
+        
+        Returns:
+            list: Chunk dicts with 'title' and 'text'
+        """
+        with self._lock:
+            all_chunks = list(self.chunks)
+        if sum(len(chunk['text']) for chunk in all_chunks) <= char_budget:
+            return all_chunks
+        
+        candidates = [chunk for _, chunk in self.search(query, top_k)] or all_chunks[:top_k]
+        selected = []
+        used = 0
+        for chunk in candidates:
+            if used + len(chunk['text']) > char_budget:
+                continue
+            selected.append(chunk)
+            used += len(chunk['text'])
+        return selected
+
+# Per-conversation document indexes, least recently used threads dropped first
+class ThreadIndexStore:
+    """
+    Keep one DocumentIndex per conversation thread, bounded to max_threads entries
+    
+    Args:
+        max_threads: Maximum number of thread indexes kept in memory
+        chunk_chars: Chunk size passed to new indexes
+    """
+    
+    def __init__(self, max_threads=256, chunk_chars=1500):
+        from collections import OrderedDict
+        
+        self.max_threads = max_threads
+        self.chunk_chars = chunk_chars
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, thread_id, create=True):
+        """Return the index for thread_id, creating it when create is True"""
+        with self._lock:
+            index = self._indexes.get(thread_id)
+            if index is not None:
+                self._indexes.move_to_end(thread_id)
+            elif create:
+                index = DocumentIndex(self.chunk_chars)
+                self._indexes[thread_id] = index
+                while len(self._indexes) > self.max_threads:
+                    self._indexes.popitem(last=False)
+            return index
+
+# Cache of agent answers for repeated prompts, with TTL and LRU eviction
+class ResponseCache:
+    """
+    Cache agent responses keyed by the normalized prompt and the agent id/alias
+    
+    Entries expire after ttl_seconds and the least recently used entry is dropped once
+    max_entries is reached. Only use it for turns whose input is the bare prompt.
+    
+    Args:
+        ttl_seconds: Lifetime of a cached response
+        max_entries: Maximum number of cached responses
+    """
+    
+    def __init__(self, ttl_seconds=3600, max_entries=1024):
+        from collections import OrderedDict
+        
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(prompt, agent_id, agent_alias_id):
+        normalized = ' '.join(prompt.lower().split())
+        return (normalized, agent_id, agent_alias_id)
+    
+    def get(self, prompt, agent_id, agent_alias_id):
+        """Return the cached response or None"""
+        import time
+        
+        key = self._key(prompt, agent_id, agent_alias_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                response_text = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                response_text = None
+            size = len(self._entries)
+        registry.inc("chatbot_response_cache_lookups_total", {"result": "miss" if response_text is None else "hit"},
+                     help_text="Response cache lookups by result")
+        registry.set_gauge("chatbot_response_cache_entries", {}, size, help_text="Responses held in the cache")
+        return response_text
+    
+    def put(self, prompt, agent_id, agent_alias_id, response_text):
+        """Store a response for the prompt"""
+        import time
+        
+        key = self._key(prompt, agent_id, agent_alias_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response_text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """Return hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries)
+            }